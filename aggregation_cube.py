@@ -0,0 +1,221 @@
+"""
+Cubo de conteos precalculado para el tab de gráficos estadísticos
+Agrupa los registros por (State, Severity, Year, Hour, Day_of_Week, Weather_Condition, bin de temperatura)
+y responde cualquier gráfico bajo cualquier combinación de filtros sumando celdas, sin recorrer filas
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+import polars as pl
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import query_engine as qe
+
+
+class AggregationCube:
+    TEMPERATURE_COLUMN = 'Temperature(F)'
+    TEMPERATURE_BINS = 50
+
+    DIMENSIONS = ['State', 'Severity', 'Year', 'Hour', 'Day_of_Week', 'Weather_Condition', 'Temp_Bin']
+
+    # Nombre del filtro (como en DataManager.filter_data) -> dimensión del cubo
+    FILTERS = {
+        'states': 'State',
+        'severity': 'Severity',
+        'years': 'Year',
+        'weather': 'Weather_Condition',
+    }
+
+    def __init__(self, codes: Dict[str, np.ndarray], labels: Dict[str, list],
+                 counts: np.ndarray, temperature_edges: Optional[np.ndarray]):
+        # codes[dimensión][celda] = código del valor (-1 = nulo); labels[dimensión][código] = valor
+        self.codes = codes
+        self.labels = labels
+        self.counts = counts
+        self.temperature_edges = temperature_edges
+        self._lookup = {dim: {value: code for code, value in enumerate(values)} for dim, values in labels.items()}
+
+    # Construir el cubo desde un DataFrame de Pandas o un LazyFrame de Polars
+    # temperature_edges: bins de temperatura de otro cubo (para poder combinarlos con merge)
+    @classmethod
+    def from_frame(cls, df, temperature_edges: Optional[np.ndarray] = None) -> 'AggregationCube':
+        if qe.is_lazy(df):
+            return cls._from_lazy_frame(df, temperature_edges)
+        return cls._from_pandas(df, temperature_edges)
+
+    # Bordes de los bins de temperatura (rango completo del dataset)
+    @classmethod
+    def _temperature_edges(cls, vmin, vmax) -> Optional[np.ndarray]:
+        if vmin is None or pd.isna(vmin):
+            return None
+        if vmax <= vmin:
+            vmax = vmin + 1
+        return np.linspace(float(vmin), float(vmax), cls.TEMPERATURE_BINS + 1)
+
+    # Bordes de los bins de temperatura de una consulta diferida (solo lee esa columna)
+    @classmethod
+    def lazy_temperature_edges(cls, lf: pl.LazyFrame) -> Optional[np.ndarray]:
+        if cls.TEMPERATURE_COLUMN not in qe.column_names(lf):
+            return None
+        temperature = pl.col(cls.TEMPERATURE_COLUMN).fill_nan(None)
+        bounds = lf.select(temperature.min().alias('min'), temperature.max().alias('max')).collect()
+        return cls._temperature_edges(bounds['min'].item(), bounds['max'].item())
+
+    @classmethod
+    def _from_pandas(cls, df: pd.DataFrame, edges: Optional[np.ndarray] = None) -> 'AggregationCube':
+        dims = {dim: df[dim] for dim in cls.DIMENSIONS[:-1] if dim in df.columns}
+        if cls.TEMPERATURE_COLUMN not in df.columns:
+            edges = None
+        else:
+            temperature = df[cls.TEMPERATURE_COLUMN]
+            if edges is None:
+                edges = cls._temperature_edges(temperature.min(), temperature.max())
+        if edges is not None:
+            values = temperature.to_numpy(dtype='float64', na_value=np.nan)
+            bins = np.floor((values - edges[0]) / (edges[1] - edges[0]))
+            bins = np.clip(bins, 0, cls.TEMPERATURE_BINS - 1)
+            dims['Temp_Bin'] = pd.Series(bins).astype('Int16')
+        return cls._from_rows(dims, None, edges)
+
+    @classmethod
+    def _from_lazy_frame(cls, lf: pl.LazyFrame, edges: Optional[np.ndarray] = None) -> 'AggregationCube':
+        columns = qe.column_names(lf)
+        group_columns = [dim for dim in cls.DIMENSIONS[:-1] if dim in columns]
+        temperature = pl.col(cls.TEMPERATURE_COLUMN).fill_nan(None)
+        if cls.TEMPERATURE_COLUMN not in columns:
+            edges = None
+        elif edges is None:
+            edges = cls.lazy_temperature_edges(lf)
+        exprs = [pl.col(dim) for dim in group_columns]
+        if edges is not None:
+            width = edges[1] - edges[0]
+            exprs.append(((temperature - edges[0]) / width).floor().clip(0, cls.TEMPERATURE_BINS - 1)
+                         .cast(pl.Int16).alias('Temp_Bin'))
+
+        # El agrupamiento se resuelve en Polars; solo se recolectan las celdas
+        # convert_dtypes conserva los enteros con nulos como enteros (Pandas los pasaría a float)
+        grouped = lf.group_by(exprs).agg(pl.len().alias('count')).collect().to_pandas().convert_dtypes()
+        dims = {dim: grouped[dim] for dim in cls.DIMENSIONS if dim in grouped.columns}
+        return cls._from_rows(dims, grouped['count'].to_numpy(), edges)
+
+    # Agrupar filas (o celdas ya agregadas con sus pesos) en celdas únicas
+    @classmethod
+    def _from_rows(cls, dims: Dict[str, pd.Series], weights: Optional[np.ndarray],
+                   edges: Optional[np.ndarray]) -> 'AggregationCube':
+        row_codes, labels = {}, {}
+        key = np.zeros(len(next(iter(dims.values()))), dtype=np.int64)
+        for dim, series in dims.items():
+            codes, uniques = pd.factorize(series, use_na_sentinel=True)
+            labels[dim] = list(uniques.tolist())
+            row_codes[dim] = codes
+            # Clave compuesta en base mixta (+1 para representar los nulos)
+            radix = len(labels[dim]) + 1
+            if key.size and int(key.max()) >= (2 ** 62) // radix:
+                # Compactar la clave antes de que desborde int64
+                key = np.unique(key, return_inverse=True)[1].astype(np.int64)
+            key = key * radix + (codes + 1)
+
+        unique_keys, first_row, inverse = np.unique(key, return_index=True, return_inverse=True)
+        counts = np.bincount(inverse, weights=weights, minlength=len(unique_keys)).astype(np.int64)
+        codes = {dim: row_codes[dim][first_row].astype(np.int32) for dim in dims}
+        return cls(codes, labels, counts, edges)
+
+    # Celdas que cumplen los filtros
+    def _mask(self, **filters) -> Optional[np.ndarray]:
+        mask = None
+        for name, dim in self.FILTERS.items():
+            values = filters.get(name)
+            if not values or dim not in self.codes:
+                continue
+            lookup = self._lookup[dim]
+            selected = [lookup[v] for v in values if v in lookup]
+            dim_mask = np.isin(self.codes[dim], selected)
+            mask = dim_mask if mask is None else mask & dim_mask
+        return mask
+
+    # Total de registros bajo los filtros
+    def count(self, **filters) -> int:
+        mask = self._mask(**filters)
+        return int(round(self.counts.sum() if mask is None else self.counts[mask].sum()))
+
+    # Conteo por valor de una dimensión, equivalente a query_engine.value_counts
+    def value_counts(self, column: str, sort_index: bool = False, top: Optional[int] = None, **filters) -> pd.Series:
+        mask = self._mask(**filters)
+        codes = self.codes[column] if mask is None else self.codes[column][mask]
+        counts = self.counts if mask is None else self.counts[mask]
+        valid = codes >= 0
+        totals = np.rint(np.bincount(codes[valid], weights=counts[valid], minlength=len(self.labels[column]))).astype(np.int64)
+
+        result = pd.Series(totals, index=pd.Index(self.labels[column], name=column), name='count')
+        result = result[result > 0]
+        if sort_index:
+            result = result.sort_index()
+        else:
+            result = result.sort_values(ascending=False, kind='stable')
+        if top is not None:
+            result = result.head(top)
+        return result
+
+    # Semiancho del intervalo de confianza de cada conteo: None, los conteos del cubo son exactos
+    # (ver approximate.ApproximateCube)
+    def margins(self, counts) -> Optional[np.ndarray]:
+        return None
+
+    # Histograma de temperatura: centro de cada bin ('Temperature(F)') y su conteo ('count')
+    def temperature_histogram(self, **filters) -> pd.DataFrame:
+        if self.temperature_edges is None or 'Temp_Bin' not in self.codes:
+            return pd.DataFrame({self.TEMPERATURE_COLUMN: [], 'count': []})
+
+        bins = self.value_counts('Temp_Bin', **filters)
+        counts = np.zeros(self.TEMPERATURE_BINS, dtype=np.int64)
+        counts[np.asarray(bins.index, dtype=int)] = bins.to_numpy()
+        centers = (self.temperature_edges[:-1] + self.temperature_edges[1:]) / 2
+        return pd.DataFrame({self.TEMPERATURE_COLUMN: centers, 'count': counts})
+
+    # Celdas del cubo como DataFrame (para inspección o persistencia)
+    def to_frame(self) -> pd.DataFrame:
+        data = {}
+        for dim, codes in self.codes.items():
+            labels = np.array(self.labels[dim] + [None], dtype=object)
+            data[dim] = labels[codes]
+        data['count'] = self.counts
+        return pd.DataFrame(data)
+    
+    # Sumar las celdas de otro cubo (por ejemplo, el de un lote nuevo) sin recorrer filas
+    # Ambos cubos deben compartir los bins de temperatura (ver from_frame)
+    def merge(self, other: 'AggregationCube') -> 'AggregationCube':
+        same_edges = (self.temperature_edges is None and other.temperature_edges is None) or (
+            self.temperature_edges is not None and other.temperature_edges is not None
+            and np.array_equal(self.temperature_edges, other.temperature_edges))
+        if not same_edges:
+            raise ValueError("Los cubos tienen bins de temperatura distintos")
+        
+        frame = pd.concat([self.to_frame(), other.to_frame()], ignore_index=True)
+        dims = {dim: frame[dim] for dim in self.DIMENSIONS if dim in frame.columns}
+        return self._from_rows(dims, frame['count'].to_numpy(), self.temperature_edges)
+    
+    # Guardar las celdas en Parquet (los bordes de temperatura van en los metadatos)
+    def save(self, path: str):
+        table = pa.Table.from_pandas(self.to_frame(), preserve_index=False)
+        edges = None if self.temperature_edges is None else self.temperature_edges.tolist()
+        metadata = {**(table.schema.metadata or {}), b'temperature_edges': json.dumps(edges).encode()}
+        
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        pq.write_table(table.replace_schema_metadata(metadata), tmp_path)
+        os.replace(tmp_path, path)
+    
+    @classmethod
+    def load(cls, path: str) -> 'AggregationCube':
+        table = pq.read_table(path)
+        edges = json.loads(table.schema.metadata.get(b'temperature_edges', b'null'))
+        # convert_dtypes conserva los enteros con nulos como enteros
+        frame = table.to_pandas().convert_dtypes()
+        dims = {dim: frame[dim] for dim in cls.DIMENSIONS if dim in frame.columns}
+        return cls._from_rows(dims, frame['count'].to_numpy(), None if edges is None else np.asarray(edges))
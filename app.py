@@ -1,7 +1,8 @@
+import time
 import streamlit as st
-from data_manager import get_data_manager
+import profiling
+import loader
 from config import setup_page_config, apply_custom_css
-from tabs import show_tabla_interactiva, show_graficos_estadisticos, show_mapa_interactivo
 
 def main():
     # Configurar página y estilos
@@ -21,9 +22,6 @@ def main():
         **Período:** 2020-2023 (muestra optimizada)  
         """)
     
-    # Inicializar datos 
-    data_manager = get_data_manager()
-
     # Sidebar para filtros
     st.sidebar.markdown("## 🎛️ Filtros de Análisis")
     
@@ -32,20 +30,31 @@ def main():
     
     performance_mode = st.sidebar.selectbox(
         "Modo de Rendimiento",
-        ["🚀 Rápido (50k registros)", "⚖️ Balanceado (150k registros)", "🐌 Lento (250k registros)"],
+        ["🚀 Rápido (50k registros)", "⚖️ Balanceado (150k registros)", "🐌 Lento (250k registros)", "♾️ Completo (consultas Polars)",
+         "🎯 Aproximado (estimación progresiva)"],
         help="Controla la cantidad de datos que se van a procesar para optimizar rendimiento"
     )
     
     # Configurar límites según el modo
+    aproximado = False
     if "Rápido" in performance_mode:
         sample_size = 50000
         warning_msg = "🚀 Modo rápido: Procesando 50k registros"
     elif "Balanceado" in performance_mode:
         sample_size = 150000
         warning_msg = "⚖️ Modo balanceado: Procesando 150k registros"
-    else:
+    elif "Lento" in performance_mode:
         sample_size = 250000
         warning_msg = "🐌 Modo lento: Procesando 250k registros"
+    elif "Completo" in performance_mode:
+        # Sin muestreo: el dataset se consulta de forma diferida con Polars
+        sample_size = None
+        warning_msg = "♾️ Modo completo: Consultas sobre todos los registros"
+    else:
+        # Dataset completo; resumen y gráficos se estiman primero con el 1% y el 10% de los registros
+        sample_size = None
+        aproximado = True
+        warning_msg = "🎯 Modo aproximado: Estimaciones con intervalos de confianza mientras se calculan los valores exactos"
 
     st.sidebar.warning(warning_msg)
     st.sidebar.info("ℹ️ Recomendamos usar el modo rápido o balanceado para una mejor experiencia. El modo lento puede tardar varios minutos en cargar.")
@@ -53,15 +62,24 @@ def main():
     # Botón para cargar datos
     if st.sidebar.button("📊 Cargar Dataset", type="primary"):
         st.session_state.data_loaded = True
+        # Las muestras son prefijos anidados de un mismo archivo: cambiar de modo no recarga el dataset
         st.session_state.sample_size = sample_size
-        # Limpiar cache cuando se cambia el modo de rendimiento
-        if 'cached_sample_size' not in st.session_state or st.session_state.cached_sample_size != sample_size:
-            st.cache_data.clear()
-            st.session_state.cached_sample_size = sample_size
+        st.session_state.aproximado = aproximado
     
     # Verificar si los datos están cargados
     if 'data_loaded' not in st.session_state:
         st.session_state.data_loaded = False
+    
+    # El dataset se prepara en segundo plano desde la página inicial (descarga, conversión y muestra)
+    progreso = loader.start()
+    if progreso is not None and not st.session_state.data_loaded:
+        estado = progreso.snapshot()
+        if estado['error']:
+            st.sidebar.caption("⚠️ La preparación en segundo plano falló; el dataset se cargará al pulsar el botón")
+        elif estado['done']:
+            st.sidebar.caption("✅ Dataset preparado")
+        else:
+            st.sidebar.progress(estado['fraction'], text=f"⏳ {estado['stage']}...")
 
     # Preguntas de investigación
     if not st.session_state.data_loaded:
@@ -96,61 +114,213 @@ def main():
         
         return
     
+    # Los módulos de datos y visualización (Pandas, Polars, PyArrow) se importan recién al cargar
+    # el dataset: la página inicial no paga ese costo en cada arranque en frío
+    from data_manager import get_data_manager
+    import query_engine as qe
+    import approximate
+    from tabs import show_filtros, show_tabla_interactiva, show_graficos_estadisticos, show_mapa_interactivo
+    
+    # Si la preparación en segundo plano no terminó, mostrar su progreso y los resultados parciales
+    if progreso is not None:
+        show_progreso_carga(progreso)
+    
+    # Inicializar datos 
+    data_manager = get_data_manager()
+    
     # Cargar datos con límite según modo de rendimiento
     sample_size = st.session_state.get('sample_size', 100000)
+    aproximado = st.session_state.get('aproximado', False)
     
     with st.spinner(f'📊 Cargando {"todos los" if sample_size is None else f"{sample_size:,}"} registros del dataset...'):
-        df = data_manager.load_data(sample_size=sample_size)
+        if sample_size is None:
+            # Modo completo: filtros y agregaciones se resuelven como consultas diferidas
+            df = data_manager.scan_data()
+        else:
+            df = data_manager.load_data(sample_size=sample_size)
     
-    if df is None or df.empty:
+    total_registros = data_manager.count_rows(df) if df is not None else 0
+    if total_registros == 0:
         st.error("❌ No se pudo cargar el dataset. Verificar conexión a internet.")
         return
     
     # Mostrar información sobre los datos cargados
-    st.success(f"✅ **Datos cargados exitosamente**: {len(df):,} registros procesados")
+    st.success(f"✅ **Datos cargados exitosamente**: {total_registros:,} registros procesados")
+    
+    # Resumen del dataset (en el modo aproximado, estimaciones hasta que el exacto esté listo)
+    # Cálculos exactos en segundo plano que este rerun dejó en curso (modo aproximado)
+    pendientes = []
+    panel_resumen = st.empty()
+    if aproximado:
+        calcular_resumen = lambda: data_manager.get_data_summary(df)
+        summary = data_manager.background_result(('resumen',), df, calcular_resumen, pendientes)
+        for fraccion in approximate.FRACTIONS:
+            if summary is not None:
+                break
+            with panel_resumen.container():
+                show_metricas(data_manager.get_approximate_summary(df, fraccion), total_registros, fraccion)
+            summary = data_manager.background_result(('resumen',), df, calcular_resumen, pendientes)
+    else:
+        summary = data_manager.get_data_summary(df)
+    
+    if summary is not None:
+        with panel_resumen.container():
+            show_metricas(summary, total_registros)
+    
+    # Reporte de memoria de los tipos compactos (solo aplica a muestras en memoria)
+    if not qe.is_lazy(df) and st.sidebar.checkbox("💾 Mostrar uso de memoria por columna"):
+        with st.expander("💾 Uso de memoria por columna", expanded=True):
+            memory_report = data_manager.get_memory_report(df)
+            ahorro_total = memory_report['Bytes_Ahorrados'].sum() / 1024**2
+            actual_total = memory_report['Bytes_Actual'].sum() / 1024**2
+            st.caption(f"Memoria actual: {actual_total:,.1f} MB · Ahorro frente a tipos por defecto: {ahorro_total:,.1f} MB")
+            st.dataframe(memory_report, use_container_width=True, hide_index=True)
+
+    # Estado de la caché compartida del proceso
+    with st.sidebar.expander("🗄️ Caché"):
+        cache_stats = data_manager.cache.stats()
+        consultas = cache_stats['hits'] + cache_stats['misses']
+        st.caption(f"Entradas: {cache_stats['entries']} · "
+                   f"Memoria: {cache_stats['bytes'] / 1024**2:,.1f} / {cache_stats['max_bytes'] / 1024**2:,.0f} MB")
+        st.caption(f"Aciertos: {cache_stats['hits']} ({cache_stats['hits'] / max(consultas, 1):.0%}) · "
+                   f"Fallos: {cache_stats['misses']} · Expulsiones: {cache_stats['evictions']}")
+
+    st.markdown("---")
+    
+    # Filtros compartidos: se dibujan siempre, sobre la vista activa
+    df_filtrado, filtros = show_filtros(df)
     
-    # Resumen del dataset
-    summary = data_manager.get_data_summary(df)
+    # Solo se ejecuta la vista elegida (st.tabs ejecutaría las tres en cada rerun)
+    vista = st.radio("Vista", ["📊 Tabla Interactiva", "📈 Gráficos Estadísticos", "🗺️ Mapa Interactivo"],
+                     horizontal=True, key="vista", label_visibility="collapsed")
     
-    # Métricas principales en la parte superior
+    if vista == "📊 Tabla Interactiva":
+        show_tabla_interactiva(df, df_filtrado, filtros)
+    elif vista == "📈 Gráficos Estadísticos":
+        # Los gráficos usan el cubo del dataset completo con los filtros
+        show_graficos_estadisticos(df, filtros, aproximado=aproximado, pendientes=pendientes)
+    else:
+        show_mapa_interactivo(df, df_filtrado, filtros)
+    
+    # Perfil del rerun (al final, para incluir las etapas de los tabs)
+    if st.sidebar.checkbox("⏱️ Mostrar perfil de la ejecución"):
+        show_panel_perfil()
+    
+    # Modo aproximado: la página ya muestra las estimaciones; al terminar los cálculos exactos
+    # de este rerun se vuelve a ejecutar para reemplazarlas
+    if pendientes:
+        esperar_calculos_exactos(data_manager, pendientes)
+
+# Métricas principales del resumen
+# fraccion: fracción de los registros de un resumen estimado (None si es exacto)
+def show_metricas(summary: dict, total_registros: int, fraccion=None):
+    # En una estimación, estados, ciudades y período son los observados en la muestra (cotas inferiores)
+    minimo = "≥ " if fraccion is not None else ""
     col1, col2, col3, col4, col5 = st.columns(5)
     
     with col1:
         st.metric("🚗 Total Accidentes", f"{summary['total_accidents']:,}")
     
     with col2:
-        st.metric("🗺️ Estados", summary['states_count'])
+        st.metric("🗺️ Estados", f"{minimo}{summary['states_count']}")
     
     with col3:
-        st.metric("🏙️ Ciudades", summary['cities_count'])
+        st.metric("🏙️ Ciudades", f"{minimo}{summary['cities_count']:,}")
     
     with col4:
         st.metric("📅 Período", summary['date_range'])
     
     with col5:
-        total_size = len(df) / 1000000
+        total_size = total_registros / 1000000
         st.metric("💾 Tamaño Dataset", f"{total_size:.1f}M")
     
-    st.markdown("---")
-    
-    # Tabs para diferentes visualizaciones
-    tab1, tab2, tab3 = st.tabs(["📊 Tabla Interactiva", "📈 Gráficos Estadísticos", "🗺️ Mapa Interactivo"])
+    if fraccion is not None:
+        temperatura = summary['avg_temperature']
+        margen = summary['margins'].get('avg_temperature')
+        detalle = f" · Temperatura promedio: {temperatura} ± {margen} °F (IC 95%)" if margen is not None else ""
+        st.caption(f"🎯 Estimación con el {fraccion:.0%} de los registros ({summary['sample_rows']:,} filas); "
+                   f"estados, ciudades y período son los observados en la muestra{detalle}. "
+                   f"Los valores exactos se calculan en segundo plano.")
+
+# Segundos entre actualizaciones del progreso de la carga y de los cálculos exactos
+INTERVALO_PROGRESO = 0.5
+
+# Esperar en pasos cortos los cálculos exactos de este rerun y volver a ejecutar al terminar
+# Como en show_progreso_carga, cada paso actualiza un elemento: una interacción del usuario
+# interrumpe la espera (los cálculos siguen en sus hilos y el siguiente rerun los retoma)
+def esperar_calculos_exactos(data_manager, pendientes: list):
+    aviso = st.empty()
+    while pendientes:
+        aviso.caption(f"⏳ Calculando {len(pendientes)} resultado(s) exacto(s) en segundo plano...")
+        pendientes = data_manager.wait_background(pendientes, timeout=INTERVALO_PROGRESO)
+    aviso.empty()
+    st.rerun()
+
+# Esperar la carga en segundo plano mostrando su avance por bloques y un resumen de las filas leídas
+# Cada actualización es un elemento de Streamlit: una interacción del usuario interrumpe la espera
+# (la carga sigue en su hilo y el siguiente rerun retoma el progreso)
+def show_progreso_carga(progreso):
+    import summary
+    from data_manager import DataManager
     
-    # ==================== TAB 1: TABLA INTERACTIVA ====================
-    with tab1:
-        df_filtrado = show_tabla_interactiva(df)
+    estado = progreso.snapshot()
+    if estado['done']:
+        if estado['error']:
+            st.warning(f"⚠️ La preparación en segundo plano falló ({estado['error']}); cargando de nuevo...")
+        return
     
-    # ==================== TAB 2: GRÁFICOS ESTADÍSTICOS ====================
-    with tab2:
-        # Usar el DataFrame filtrado del tab1 si existe, sino usar el original
-        df_para_graficos = df_filtrado if 'df_filtrado' in locals() else df
-        show_graficos_estadisticos(df_para_graficos)
+    st.markdown("### ⏳ Preparando el dataset")
+    barra = st.progress(0.0)
+    parcial = st.empty()
+    bloques_mostrados = None
+    while not estado['done']:
+        barra.progress(estado['fraction'], text=f"{estado['stage']} · {estado['chunks']} bloques · "
+                                               f"{estado['rows']:,} registros leídos")
+        resumen = {}
+        if estado['states'] is not None and estado['chunks'] != bloques_mostrados:
+            bloques_mostrados = estado['chunks']
+            resumen = DataManager._format_summary(summary.finalize(estado['states']))
+        if resumen:
+            with parcial.container():
+                st.caption("Resultados parciales de los bloques leídos hasta ahora")
+                col1, col2, col3, col4 = st.columns(4)
+                col1.metric("🚗 Registros leídos", f"{resumen['total_accidents']:,}")
+                col2.metric("🗺️ Estados", resumen['states_count'])
+                col3.metric("🏙️ Ciudades", f"{resumen['cities_count']:,}")
+                col4.metric("📅 Período", resumen['date_range'])
+                st.dataframe(estado['preview'], use_container_width=True, hide_index=True)
+        time.sleep(INTERVALO_PROGRESO)
+        estado = progreso.snapshot()
     
-    # ==================== TAB 3: MAPA INTERACTIVO ====================
-    with tab3:
-        # Usar el DataFrame filtrado del tab1 si existe, sino usar el original
-        df_para_mapa = df_filtrado if 'df_filtrado' in locals() else df
-        show_mapa_interactivo(df_para_mapa)
+    barra.empty()
+    parcial.empty()
+    if estado['error']:
+        st.warning(f"⚠️ La preparación en segundo plano falló ({estado['error']}); cargando de nuevo...")
+
+# Panel de depuración: etapas del rerun actual y métricas del proceso
+def show_panel_perfil():
+    with st.sidebar.expander("⏱️ Perfil de la ejecución", expanded=True):
+        etapas = profiling.current_stages()
+        if etapas:
+            # Las etapas anidadas se indentan bajo la que las llamó
+            st.dataframe(
+                [{
+                    'Etapa': '· ' * etapa['depth'] + etapa['stage'],
+                    'Segundos': etapa['seconds'],
+                    'Filas': etapa['rows'],
+                    'Aciertos caché': etapa['cache_hits'],
+                    'Fallos caché': etapa['cache_misses'],
+                    'Δ Memoria (MB)': etapa['memory_delta_mb'],
+                } for etapa in etapas],
+                use_container_width=True, hide_index=True
+            )
+        p50, p95 = profiling.rerun_percentile(50), profiling.rerun_percentile(95)
+        if p95 is not None:
+            st.caption(f"Reruns anteriores: p50 {p50:.2f} s · p95 {p95:.2f} s")
+        st.download_button("📈 Métricas (Prometheus)", profiling.prometheus_text(),
+                           file_name="metrics.prom", mime="text/plain")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # Cada ejecución del script es un rerun: sus etapas se registran juntas
+    with profiling.rerun():
+        main()
\ No newline at end of file
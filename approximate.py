@@ -0,0 +1,131 @@
+"""
+Consultas aproximadas con intervalos de confianza para el modo aproximado
+Los gráficos y el resumen se responden primero con fracciones crecientes del dataset completo
+(FRACTIONS) mientras el resultado exacto se calcula en segundo plano. Una fracción son las filas con
+Sample_Key menor que ella: dentro de cada estrato de muestreo es un muestreo aleatorio simple, que
+Parquet lee saltando los row groups de claves mayores. Cada fila de la muestra pesa las filas de su
+estrato en el dataset sobre las de su estrato en la muestra (los estratos chicos están sobrerrepresentados)
+"""
+
+import math
+from typing import List
+
+import numpy as np
+import pandas as pd
+import polars as pl
+
+import query_engine as qe
+import summary
+from aggregation_cube import AggregationCube
+
+# Fracciones de las estimaciones previas al resultado exacto, de menor a mayor
+FRACTIONS = (0.01, 0.1)
+# Cuantil normal de los intervalos de confianza del 95%
+CONFIDENCE_Z = 1.96
+# Métricas del resumen que se toman de la muestra tal cual (cotas inferiores o rangos observados)
+OBSERVED_METRICS = ['start_min', 'start_max', 'states_count', 'cities_count']
+
+
+# Filas de la fracción `fraction` del dataset (cada fracción contiene a las menores)
+def sample_fraction(lf: pl.LazyFrame, fraction: float) -> pl.LazyFrame:
+    return lf.filter(pl.col('Sample_Key') < fraction)
+
+
+# Filas del dataset por estrato (columna 'population'); sin estratos, una sola fila con el total
+def strata_sizes(lf: pl.LazyFrame, strata: List[str]) -> pd.DataFrame:
+    if not strata:
+        return pd.DataFrame({'population': [qe.count_rows(lf)]})
+    return lf.group_by(strata).agg(pl.len().alias('population')).collect().to_pandas()
+
+
+# Peso de cada fila de `sample` (filas de la muestra por estrato en la columna `rows`)
+# Los valores de los estratos se comparan como objetos de Python (None para los nulos)
+def _stratum_weights(sample: pd.DataFrame, sizes: pd.DataFrame, rows: str) -> np.ndarray:
+    strata = [c for c in sizes.columns if c != 'population']
+    if not strata:
+        return np.full(len(sample), sizes['population'].sum() / max(sample[rows].sum(), 1))
+
+    def as_objects(frame: pd.DataFrame) -> pd.DataFrame:
+        frame = frame[strata].astype(object)
+        return frame.where(frame.notna(), None)
+
+    keys = as_objects(sample)
+    keys[rows] = sample[rows].to_numpy()
+    sample_rows = keys.groupby(strata, dropna=False)[rows].transform('sum')
+    population = as_objects(sizes)
+    population['population'] = sizes['population'].to_numpy()
+    matched = keys[strata].merge(population, on=strata, how='left')
+    return matched['population'].to_numpy(dtype='float64') / sample_rows.to_numpy(dtype='float64')
+
+
+# Factor de corrección por población finita
+def _finite_population(sample_rows: float, population_rows: float) -> float:
+    return math.sqrt(max(1 - sample_rows / population_rows, 0.0)) if population_rows else 0.0
+
+
+class ApproximateCube(AggregationCube):
+    # Cubo de una muestra con cada celda multiplicada por el peso de su estrato: los conteos ya son
+    # estimaciones del dataset completo. Los márgenes usan la varianza de un muestreo aleatorio simple
+    # con el tamaño efectivo de Kish (que descuenta la desigualdad de los pesos)
+    def __init__(self, codes, labels, counts, temperature_edges, sample_rows: int, effective_rows: float,
+                 population_rows: int):
+        super().__init__(codes, labels, counts, temperature_edges)
+        self.sample_rows = sample_rows
+        self.effective_rows = effective_rows
+        self.population_rows = population_rows
+
+    # lf: dataset completo; sizes: strata_sizes del dataset (sus estratos deben ser dimensiones del cubo)
+    # Los bins de temperatura cubren el rango del dataset completo, como los del cubo exacto
+    @classmethod
+    def from_sample(cls, lf: pl.LazyFrame, fraction: float, sizes: pd.DataFrame) -> 'ApproximateCube':
+        edges = cls.lazy_temperature_edges(lf)
+        cube = AggregationCube.from_frame(sample_fraction(lf, fraction), temperature_edges=edges)
+        cells = cube.to_frame()
+        weights = _stratum_weights(cells, sizes, 'count')
+        population_rows = int(sizes['population'].sum())
+        weighted_squares = float((cube.counts * weights ** 2).sum())
+        effective_rows = population_rows ** 2 / weighted_squares if weighted_squares else 0.0
+        return cls(cube.codes, cube.labels, cube.counts * weights, edges,
+                   int(cube.counts.sum()), effective_rows, population_rows)
+
+    # Semiancho del intervalo de confianza del 95% de cada conteo estimado
+    def margins(self, counts) -> np.ndarray:
+        if not self.effective_rows:
+            return np.zeros(len(counts))
+        p = np.asarray(counts, dtype='float64') / self.population_rows
+        se = np.sqrt(p * (1 - p) / self.effective_rows) * _finite_population(self.sample_rows, self.population_rows)
+        return CONFIDENCE_Z * self.population_rows * se
+
+
+# Resumen del dataset estimado con la fracción `fraction`
+# El total es el del dataset; estados, ciudades y el período son los observados en la muestra (cotas
+# inferiores); la temperatura promedio se pondera por estrato y lleva su margen en 'margins'
+def estimate_summary(lf: pl.LazyFrame, fraction: float, sizes: pd.DataFrame) -> dict:
+    sample = sample_fraction(lf, fraction)
+    values = summary.finalize(summary.compute_states(sample, [summary.METRICS[m] for m in OBSERVED_METRICS]))
+    population_rows = int(sizes['population'].sum())
+    values.update({'total_accidents': population_rows, 'avg_temperature': None, 'margins': {}})
+
+    # Sumas de la temperatura por estrato (una fila por estrato)
+    strata = [c for c in sizes.columns if c != 'population']
+    columns = qe.column_names(lf)
+    if 'Temperature(F)' in columns:
+        temperature = pl.col('Temperature(F)').cast(pl.Float64).fill_nan(None)
+        exprs = [pl.len().alias('rows'), temperature.count().alias('n'), temperature.sum().alias('sum'),
+                 (temperature * temperature).sum().alias('squares')]
+        by_stratum = (sample.group_by(strata).agg(exprs) if strata else sample.select(exprs)).collect().to_pandas()
+    else:
+        by_stratum = pd.DataFrame({'rows': [qe.count_rows(sample)]})
+    values['sample_rows'] = int(by_stratum['rows'].sum())
+
+    if 'n' in by_stratum and by_stratum['n'].sum():
+        weights = _stratum_weights(by_stratum, sizes, 'rows')
+        n = float((weights * by_stratum['n']).sum())
+        mean = float((weights * by_stratum['sum']).sum()) / n
+        variance = max(float((weights * by_stratum['squares']).sum()) / n - mean ** 2, 0.0)
+        effective = n ** 2 / float((weights ** 2 * by_stratum['n']).sum())
+        values['avg_temperature'] = round(mean, 2)
+        values['margins']['avg_temperature'] = round(
+            CONFIDENCE_Z * math.sqrt(variance / effective)
+            * _finite_population(by_stratum['n'].sum(), n), 2)
+    return values
@@ -0,0 +1,287 @@
+"""
+Benchmark de las etapas críticas sin Streamlit
+Genera un dataset sintético con la forma de US-Accidents y mide, por tamaño, la carga,
+los filtros, el resumen, las agregaciones de los gráficos y la preparación de puntos del mapa.
+Cada tamaño corre en un proceso aparte (memoria máxima independiente) y el resultado es JSON
+para comparar entre commits
+
+Con --startup mide en cambio el arranque en frío: la importación de Streamlit, la primera
+ejecución de la página inicial y qué módulos pesados quedaron cargados, con y sin la carga
+del dataset en segundo plano
+
+Uso:
+    python benchmark.py [--sizes 50k 250k 1m 7m] [--output resultados.json]
+    python benchmark.py --startup [--output arranque.json]
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import polars as pl
+
+import colors
+import query_engine as qe
+import spatial
+from cache_manager import CacheManager
+from data_manager import DataManager
+
+SIZES = {'50k': 50_000, '250k': 250_000, '1m': 1_000_000, '7m': 7_000_000}
+DEFAULT_SIZES = ['50k', '250k', '1m']
+
+# Filas por bloque al escribir el CSV sintético
+GENERATOR_CHUNK_ROWS = 500_000
+
+# Estados con su peso aproximado en US-Accidents y un centro para las coordenadas
+STATES = {
+    'CA': (0.22, 36.8, -119.4), 'FL': (0.11, 27.8, -81.7), 'TX': (0.08, 31.0, -97.6),
+    'SC': (0.05, 33.8, -80.9), 'NY': (0.05, 42.2, -74.9), 'NC': (0.05, 35.6, -79.0),
+    'VA': (0.04, 37.8, -78.2), 'PA': (0.04, 40.6, -77.2), 'MN': (0.03, 45.7, -93.9),
+    'OR': (0.03, 44.6, -122.1), 'AZ': (0.03, 33.7, -111.4), 'GA': (0.03, 33.0, -83.6),
+    'IL': (0.03, 40.3, -89.0), 'TN': (0.03, 35.7, -86.7), 'MI': (0.03, 43.3, -84.5),
+    'LA': (0.02, 31.2, -91.9), 'NJ': (0.02, 40.3, -74.5), 'MD': (0.02, 39.1, -76.8),
+    'OH': (0.02, 40.4, -82.8), 'WA': (0.02, 47.4, -121.5), 'AL': (0.02, 32.8, -86.8),
+    'UT': (0.02, 40.2, -111.9), 'CO': (0.02, 39.1, -105.3), 'OK': (0.02, 35.6, -96.9),
+    'MO': (0.02, 38.5, -92.3), 'CT': (0.01, 41.6, -72.8), 'IN': (0.01, 39.8, -86.3),
+    'MA': (0.01, 42.2, -71.5), 'WI': (0.01, 44.3, -89.6), 'KY': (0.01, 37.7, -84.7),
+}
+WEATHER = {
+    'Fair': 0.33, 'Cloudy': 0.14, 'Mostly Cloudy': 0.13, 'Clear': 0.11, 'Partly Cloudy': 0.09,
+    'Overcast': 0.05, 'Light Rain': 0.05, 'Scattered Clouds': 0.03, 'Light Snow': 0.02,
+    'Rain': 0.02, 'Fog': 0.01, 'Haze': 0.01, 'Heavy Rain': 0.01,
+}
+SEVERITY_WEIGHTS = [0.01, 0.80, 0.16, 0.03]
+CITIES_PER_STATE = 40
+
+# Filtros de la etapa de filtrado: combinación típica de la tabla interactiva
+BENCHMARK_FILTERS = {'states': ['CA', 'TX', 'FL'], 'severity': [2, 3], 'years': [2021, 2022]}
+MAP_POINTS = 15_000
+
+
+# Escribir un CSV sintético de n_rows filas con las columnas y distribuciones de US-Accidents
+def generate_dataset(n_rows: int, path: str, seed: int = 0) -> str:
+    rng = np.random.default_rng(seed)
+    states = np.array(list(STATES))
+    state_weights = np.array([w for w, _, _ in STATES.values()])
+    centers = np.array([(lat, lng) for _, lat, lng in STATES.values()])
+    weather = np.array(list(WEATHER))
+    weather_weights = np.array(list(WEATHER.values()))
+    start = np.datetime64('2016-01-01T00:00:00')
+    span_seconds = int((np.datetime64('2024-01-01T00:00:00') - start) / np.timedelta64(1, 's'))
+
+    with open(path, 'w', encoding='utf-8') as f:
+        for offset in range(0, n_rows, GENERATOR_CHUNK_ROWS):
+            n = min(GENERATOR_CHUNK_ROWS, n_rows - offset)
+            state_idx = rng.choice(len(states), n, p=state_weights / state_weights.sum())
+            times = start + rng.integers(0, span_seconds, n).astype('timedelta64[s]')
+            time_text = np.char.replace(np.datetime_as_string(times, unit='s'), 'T', ' ').astype(object)
+            # Como en el dataset original, una parte de los registros trae fracciones de segundo
+            fractional = rng.random(n) < 0.1
+            time_text[fractional] = time_text[fractional] + '.000000000'
+            temperature = rng.normal(62, 18, n)
+            temperature[rng.random(n) < 0.02] = np.nan
+            chunk = pl.DataFrame({
+                'ID': [f"A-{i}" for i in range(offset, offset + n)],
+                'Source': 'Source1',
+                'Severity': rng.choice([1, 2, 3, 4], n, p=SEVERITY_WEIGHTS),
+                'Start_Time': time_text.tolist(),
+                'Start_Lat': centers[state_idx, 0] + rng.normal(0, 1.2, n),
+                'Start_Lng': centers[state_idx, 1] + rng.normal(0, 1.6, n),
+                'City': [f"{s} City {c}" for s, c in zip(states[state_idx], rng.integers(0, CITIES_PER_STATE, n))],
+                'State': states[state_idx],
+                'Temperature(F)': temperature,
+                'Visibility(mi)': np.clip(rng.normal(9, 2.5, n), 0, 10),
+                'Weather_Condition': rng.choice(weather, n, p=weather_weights / weather_weights.sum()),
+                'Distance(mi)': rng.exponential(0.6, n),
+            })
+            chunk.write_csv(f, include_header=offset == 0)
+    return path
+
+
+# Memoria máxima del proceso (MB) hasta el momento
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux lo reporta en KB y macOS en bytes
+    return round(peak / (1024 ** 2 if sys.platform == 'darwin' else 1024), 1)
+
+
+# Medir una etapa: tiempo, memoria máxima y filas procesadas por segundo
+def measure(results: list, n_rows: int, stage: str, fn):
+    start = time.perf_counter()
+    value = fn()
+    seconds = time.perf_counter() - start
+    results.append({
+        'rows': n_rows,
+        'stage': stage,
+        'seconds': round(seconds, 4),
+        'rows_per_second': round(n_rows / seconds) if seconds > 0 else None,
+        'peak_rss_mb': peak_rss_mb(),
+    })
+    return value
+
+
+# Preparación de puntos del mapa de dispersión (muestra, limpieza y colores)
+def prepare_map_points(df, max_points: int = MAP_POINTS) -> pd.DataFrame:
+    columns = [c for c in ['Start_Lat', 'Start_Lng', 'Severity', 'City', 'State', 'Temperature(F)', 'Visibility(mi)']
+               if c in qe.column_names(df)]
+    points = qe.sample_rows(df, max_points, columns).dropna(subset=['Start_Lat', 'Start_Lng', 'Severity'])
+    points['Temperature(F)'] = points['Temperature(F)'].fillna(points['Temperature(F)'].median())
+    points[colors.RGBA_COLUMNS] = colors.severity_colors(points['Severity'])
+    return points
+
+
+# Consultas de los gráficos estadísticos sobre el cubo
+def chart_aggregations(cube, filters: dict) -> list:
+    return [
+        cube.value_counts('Severity', sort_index=True, **filters),
+        cube.value_counts('State', top=10, **filters),
+        cube.value_counts('Hour', sort_index=True, **filters),
+        cube.value_counts('Day_of_Week', **filters),
+        cube.temperature_histogram(**filters),
+        cube.value_counts('Weather_Condition', top=10, **filters),
+    ]
+
+
+# Todas las etapas para un tamaño, con una caché vacía en un directorio temporal
+def run_size(n_rows: int) -> list:
+    results = []
+    with tempfile.TemporaryDirectory(prefix='benchmark_') as workdir:
+        csv_file = str(Path(workdir) / 'us_accidents.csv')
+        measure(results, n_rows, 'generate_csv', lambda: generate_dataset(n_rows, csv_file))
+
+        data_manager = DataManager()
+        data_manager.data_path = csv_file
+        data_manager.cache_dir = Path(workdir) / 'cache'
+        # Caché propia y sin tope: cada etapa mide el cálculo, no un acierto de una etapa anterior
+        data_manager.cache = CacheManager(max_bytes=sys.maxsize)
+
+        measure(results, n_rows, 'columnar_cache', lambda: data_manager.build_columnar_cache(csv_file))
+        # Los mismos pasos que load_data, sin sus mensajes de Streamlit
+        files = data_manager.dataset_files(data_manager.fetch_dataset())
+        df = measure(results, n_rows, 'load_data', lambda: data_manager.load_sample(files, n_rows))
+        measure(results, n_rows, 'filter_index', lambda: data_manager.build_filter_index(df))
+        measure(results, n_rows, 'filter_data', lambda: data_manager.filter_data(df, **BENCHMARK_FILTERS))
+        measure(results, n_rows, 'data_summary', lambda: data_manager.get_data_summary(df))
+        cube = measure(results, n_rows, 'aggregation_cube', lambda: data_manager.build_aggregation_cube(df))
+        measure(results, n_rows, 'chart_aggregations', lambda: chart_aggregations(cube, BENCHMARK_FILTERS))
+        measure(results, n_rows, 'spatial_bins', lambda: data_manager.build_spatial_bins(df))
+        measure(results, n_rows, 'map_points', lambda: prepare_map_points(df))
+        bounds = spatial.viewport_bounds(36.8, -119.4, 7)
+        measure(results, n_rows, 'viewport_points',
+                lambda: data_manager.get_viewport_points(df, bounds, MAP_POINTS, ['Start_Lat', 'Start_Lng', 'Severity']))
+
+        # Modo completo: las mismas consultas empujadas a Polars sobre los archivos particionados
+        lf = data_manager.scan_dataset(files)
+        measure(results, n_rows, 'lazy_filter_count',
+                lambda: qe.count_rows(data_manager.filter_data(lf, **BENCHMARK_FILTERS)))
+        measure(results, n_rows, 'lazy_data_summary', lambda: data_manager.get_data_summary(lf))
+        measure(results, n_rows, 'lazy_aggregation_cube', lambda: data_manager.build_aggregation_cube(lf))
+        # Modo aproximado: primera estimación de los gráficos y del resumen (1% de los registros)
+        measure(results, n_rows, 'approximate_cube_1pct', lambda: data_manager.build_approximate_cube(lf, 0.01))
+        measure(results, n_rows, 'approximate_summary_1pct', lambda: data_manager.get_approximate_summary(lf, 0.01))
+        measure(results, n_rows, 'lazy_map_points', lambda: prepare_map_points(lf))
+    return results
+
+
+# Módulos pesados que la página inicial no debería importar
+HEAVY_MODULES = ['pandas', 'numpy', 'polars', 'pyarrow', 'plotly.express', 'pydeck', 'geopandas', 'gdown']
+STARTUP_RUNS = 5
+
+# Script de la medición de arranque; corre en un intérprete nuevo para partir sin módulos cargados
+STARTUP_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+streamlit_seconds = time.perf_counter() - start
+start = time.perf_counter()
+AppTest.from_file({app!r}, default_timeout=120).run()
+landing_seconds = time.perf_counter() - start
+print(json.dumps({{
+    'streamlit_import': streamlit_seconds,
+    'landing_page': landing_seconds,
+    'heavy_modules': [m for m in {modules!r} if m in sys.modules],
+}}))
+"""
+
+
+# Arranque en frío: mediana de `runs` procesos nuevos por etapa, con la configuración por defecto
+# (la carga en segundo plano importa Pandas y Polars y prepara el dataset mientras se dibuja la
+# página inicial) y sin ella (PREFETCH_DATASET=0: lo que cuesta la página inicial por sí sola)
+def run_startup(runs: int = STARTUP_RUNS) -> list:
+    app_dir = Path(__file__).parent
+    script = STARTUP_SCRIPT.format(app=str(app_dir / 'app.py'), modules=HEAVY_MODULES)
+    results = []
+    for prefetch, suffix in (('1', ''), ('0', '_no_prefetch')):
+        env = {**os.environ, 'PREFETCH_DATASET': prefetch}
+        samples = []
+        for _ in range(runs):
+            output = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True,
+                                    cwd=app_dir, env=env, check=True).stdout
+            samples.append(json.loads(output.strip().splitlines()[-1]))
+        results.extend({
+            'stage': f"startup_{stage}{suffix}",
+            'seconds': round(statistics.median(sample[stage] for sample in samples), 4),
+            'runs': runs,
+            'prefetch': prefetch == '1',
+            'heavy_modules': samples[-1]['heavy_modules'],
+        } for stage in ('streamlit_import', 'landing_page'))
+    return results
+
+
+# Commit actual, si el benchmark corre dentro del repositorio
+def current_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=Path(__file__).parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de carga, filtros, agregaciones y mapa")
+    parser.add_argument('--sizes', nargs='+', choices=list(SIZES), default=DEFAULT_SIZES,
+                        help="Tamaños del dataset sintético")
+    parser.add_argument('--startup', action='store_true',
+                        help="Medir el arranque en frío de la página inicial en lugar de las etapas de datos")
+    parser.add_argument('--output', help="Archivo JSON de salida (por defecto, la salida estándar)")
+    args = parser.parse_args()
+
+    results = []
+    if args.startup:
+        results = run_startup()
+    else:
+        # Un proceso nuevo por tamaño ('spawn': Polars no es seguro con fork)
+        context = multiprocessing.get_context('spawn')
+        for size in args.sizes:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                results.extend(pool.submit(run_size, SIZES[size]).result())
+            print(f"{size}: listo", file=sys.stderr)
+
+    report = {
+        'commit': current_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'versions': {'pandas': pd.__version__, 'polars': pl.__version__, 'numpy': np.__version__},
+        'results': results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
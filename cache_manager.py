@@ -0,0 +1,125 @@
+"""
+Caché en memoria compartida por todas las sesiones del proceso
+Las entradas se identifican por claves explícitas (versión del dataset, muestra, firma de filtros)
+y se expulsan por antigüedad de uso (LRU) cuando se supera el presupuesto de memoria
+"""
+
+import os
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+# Presupuesto de memoria configurable con la variable de entorno CACHE_MAX_MB
+DEFAULT_MAX_BYTES = int(os.environ.get('CACHE_MAX_MB', '2048')) * 1024 ** 2
+
+
+# Estimar la memoria que ocupa un objeto cacheado
+def estimate_size(value: Any, _seen: Optional[set] = None) -> int:
+    # Importados aquí para que profiling (que usa la caché) no cargue Pandas al arrancar la aplicación
+    import numpy as np
+    import pandas as pd
+    
+    seen = _seen if _seen is not None else set()
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, (pd.Series, pd.Index)):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(k, seen) + estimate_size(v, seen) for k, v in value.items())
+    if isinstance(value, (list, tuple, set)):
+        return sys.getsizeof(value) + sum(estimate_size(item, seen) for item in value)
+    if hasattr(value, 'nbytes') and isinstance(getattr(value, 'nbytes'), (int, np.integer)):
+        return int(value.nbytes)
+    if hasattr(value, '__dict__'):
+        # Objetos propios (índices, cubos): sumar sus atributos
+        return sys.getsizeof(value) + estimate_size(vars(value), seen)
+    return sys.getsizeof(value)
+
+
+class CacheManager:
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.RLock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # Retornar el valor cacheado o calcularlo y guardarlo
+    # Los valores cacheados son compartidos: quien los usa no debe modificarlos
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+
+        # Calcular fuera del candado para no bloquear a otras sesiones
+        value = compute()
+        self.put(key, value)
+        return value
+
+    # Valor cacheado o None, sin calcularlo
+    def get(self, key: Hashable) -> Any:
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+
+    # Guardar un valor; si no cabe en el presupuesto se retorna sin cachear
+    def put(self, key: Hashable, value: Any):
+        size = estimate_size(value)
+        if value is None or size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._sizes[key]
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            self._sizes[key] = size
+            self.current_bytes += size
+            self._evict()
+
+    # Expulsar las entradas usadas hace más tiempo hasta respetar el presupuesto
+    def _evict(self):
+        while self.current_bytes > self.max_bytes and self._entries:
+            key, _ = self._entries.popitem(last=False)
+            self.current_bytes -= self._sizes.pop(key)
+            self.evictions += 1
+
+    # Contadores para monitoreo
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+_cache_manager = None
+_cache_manager_lock = threading.Lock()
+
+
+# Caché única del proceso
+def get_cache_manager() -> CacheManager:
+    global _cache_manager
+    with _cache_manager_lock:
+        if _cache_manager is None:
+            _cache_manager = CacheManager()
+        return _cache_manager
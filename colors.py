@@ -0,0 +1,95 @@
+"""
+Mapeo vectorizado de valores a colores RGBA para las capas de PyDeck
+Todos los colores se calculan de una vez como un arreglo NumPy uint8 de forma (N, 4)
+"""
+
+import numpy as np
+import pandas as pd
+
+# Color de respaldo para severidades desconocidas
+DEFAULT_COLOR = [128, 128, 128, 160]
+
+# Tabla de colores indexada por severidad (1-4)
+SEVERITY_COLORS = np.array([
+    DEFAULT_COLOR,
+    [0, 255, 0, 160],    # Verde
+    [255, 255, 0, 160],  # Amarillo
+    [255, 165, 0, 160],  # Naranja
+    [255, 0, 0, 160],    # Rojo
+], dtype=np.uint8)
+
+# Valor de canal para registros sin dato en las escalas continuas
+NAN_CHANNEL = 128
+
+RGBA_COLUMNS = ['r', 'g', 'b', 'a']
+
+
+# Convertir canales en [0, 255] a uint8 truncando como int(), con valor fijo para los NaN
+def _channel(values: np.ndarray, nan_mask: np.ndarray) -> np.ndarray:
+    channel = np.clip(np.nan_to_num(values, nan=0.0), 0, 255).astype(np.uint8)
+    channel[nan_mask] = NAN_CHANNEL
+    return channel
+
+
+# Valores numéricos como float64 (los nulos pasan a NaN)
+def _as_float(series: pd.Series) -> np.ndarray:
+    return pd.to_numeric(series, errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+
+
+# Color uniforme para todos los registros
+def constant_colors(n: int, color) -> np.ndarray:
+    return np.tile(np.asarray(color, dtype=np.uint8), (n, 1))
+
+
+# Colores por severidad usando la tabla de búsqueda
+def severity_colors(severity: pd.Series) -> np.ndarray:
+    values = _as_float(severity)
+    valid = np.isin(values, np.arange(1, len(SEVERITY_COLORS)))
+    codes = np.where(valid, np.nan_to_num(values), 0).astype(np.intp)
+    return SEVERITY_COLORS[codes]
+
+
+# Colores por temperatura: azul (frío) -> rojo (calor)
+def temperature_colors(temperature: pd.Series) -> np.ndarray:
+    values = _as_float(temperature)
+    temp_min, temp_max = np.nanmin(values, initial=np.inf), np.nanmax(values, initial=-np.inf)
+    if not (np.isfinite(temp_min) and np.isfinite(temp_max) and temp_max > temp_min):
+        # Color por defecto si no hay rango válido
+        return constant_colors(len(values), [100, 100, 255, 160])
+
+    norm = (values - temp_min) / (temp_max - temp_min)
+    nan_mask = np.isnan(norm)
+    rgba = np.empty((len(values), 4), dtype=np.uint8)
+    rgba[:, 0] = _channel(255 * norm, nan_mask)
+    rgba[:, 1] = 100
+    rgba[:, 2] = _channel(255 * (1 - norm), nan_mask)
+    rgba[:, 3] = 160
+    return rgba
+
+
+# Colores por visibilidad: rojo (baja) -> amarillo (media) -> verde (alta)
+def visibility_colors(visibility: pd.Series) -> np.ndarray:
+    values = _as_float(visibility)
+    vis_max = np.nanmax(values, initial=-np.inf)
+    if not (np.isfinite(vis_max) and vis_max > 0):
+        return constant_colors(len(values), [100, 255, 100, 160])
+
+    norm = values / vis_max
+    nan_mask = np.isnan(norm)
+    rgba = np.empty((len(values), 4), dtype=np.uint8)
+    rgba[:, 0] = _channel(255 * (1 - norm), nan_mask)
+    rgba[:, 1] = _channel(255 * np.minimum(2 * norm, 2 * (1 - norm)), nan_mask)
+    rgba[:, 2] = _channel(255 * norm, nan_mask)
+    rgba[:, 3] = 200
+    return rgba
+
+
+# Colores por severidad promedio (escala continua): verde (1) -> rojo (4)
+def mean_severity_colors(mean_severity: pd.Series, alpha: int = 180) -> np.ndarray:
+    t = np.clip((_as_float(mean_severity) - 1) / 3, 0, 1)
+    rgba = np.empty((len(t), 4), dtype=np.uint8)
+    rgba[:, 0] = (255 * t).astype(np.uint8)
+    rgba[:, 1] = (255 * (1 - t)).astype(np.uint8)
+    rgba[:, 2] = 0
+    rgba[:, 3] = alpha
+    return rgba
@@ -6,12 +6,30 @@ Optimizado para manejar datasets grandes con Polars y GeoPandas
 import streamlit as st
 import pandas as pd
 import polars as pl
-import geopandas as gpd
-import gdown
 from pathlib import Path
+import hashlib
+import json
 import os
-from typing import Optional, Tuple
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import nullcontext
+from typing import TYPE_CHECKING, Callable, Optional, Tuple, Union
 import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import query_engine as qe
+from filter_index import FilterIndex, SortIndex
+from aggregation_cube import AggregationCube
+from region_aggregates import RegionAggregates
+import spatial
+import summary
+import approximate
+from cache_manager import get_cache_manager
+from profiling import profiled
+
+if TYPE_CHECKING:
+    import geopandas as gpd
 
 # Gestor de datos
 class DataManager:    
@@ -19,55 +37,426 @@ class DataManager:
     GDRIVE_FILE_ID = "1_T0CVP34NUlWyyYBjgdzTr32dLv6fpQu"
     GDRIVE_URL = f"https://drive.google.com/uc?id={GDRIVE_FILE_ID}"
     
+    # Caché columnar (Parquet) generada a partir del CSV
+    CACHE_DIR = "cache"
+    CACHE_VERSION = 6
+    
+    # El dataset se guarda particionado al estilo Hive (Year=2021/Month=03/...): las consultas
+    # con filtro de año solo abren los archivos de esos años. Las columnas de partición no se
+    # guardan dentro de los archivos, se leen de la ruta con estos tipos
+    PARTITION_COLUMNS = ['Year', 'Month']
+    HIVE_SCHEMA = {'Year': pl.Int16, 'Month': pl.Int8}
+    # Lotes incorporados con ingest.py: mismas particiones, en un directorio aparte de la caché
+    # (uno por CACHE_VERSION: los lotes con el esquema de otra versión se deben volver a incorporar)
+    INGEST_DIR = "ingested"
+    # Artefactos derivados persistidos (cubo, celdas del mapa, resumen por estado), un directorio
+    # por versión del dataset y muestra; precompute.py los genera antes del despliegue
+    ARTIFACTS_DIR = "artifacts"
+    
+    # Hilos para los resultados exactos del modo aproximado (compartidos por todas las sesiones)
+    BACKGROUND_WORKERS = 2
+    
+    # Muestras anidadas: cada fila tiene una clave aleatoria (Sample_Key) y una muestra son las
+    # filas de menor clave, así cada muestra es un prefijo de la siguiente y cambiar de modo
+    # es solo un recorte
+    SAMPLE_TIERS = (50_000, 150_000, 250_000)
+    SAMPLE_SEED = 42
+    # Estratificar por (State, Severity) garantizando un mínimo de filas por estrato
+    STRATIFY_SAMPLES = True
+    STRATA_COLUMNS = ['State', 'Severity']
+    MIN_ROWS_PER_STRATUM = 5
+    # Dentro de cada partición las filas van ordenadas por estado en row groups pequeños:
+    # las estadísticas min/max de State permiten saltar los row groups de otros estados
+    PARQUET_ROW_GROUP_SIZE = 10_000
+    
+    # Esquema declarativo: solo se leen del CSV las columnas que usan los tabs
+    COLUMN_SCHEMA = {
+        'ID': pl.String,
+        'Start_Time': pl.String,
+        'Start_Lat': pl.Float32,
+        'Start_Lng': pl.Float32,
+        'State': pl.Categorical,
+        'City': pl.Categorical,
+        'Severity': pl.Int8,
+        'Weather_Condition': pl.Categorical,
+        'Temperature(F)': pl.Float32,
+        'Visibility(mi)': pl.Float32,
+        'Distance(mi)': pl.Float32,
+    }
+    
+    # Conversión del CSV por bloques: cada bloque es un paso del progreso de la carga
+    CSV_BLOCK_BYTES = 16 * 1024 ** 2
+    # Tipos de Arrow de las columnas numéricas al leer por bloques (las demás se leen como texto)
+    ARROW_TYPES = {pl.Float32: pa.float32(), pl.Int8: pa.int8()}
+    
+    # Exportaciones de datos filtrados (escritas por bloques, una por combinación de filtros)
+    EXPORT_DIR = "exports"
+    EXPORT_CHUNK_ROWS = 100_000
+    EXPORT_MAX_FILES = 20
+    # Columnas internas que no se exportan (claves de muestreo)
+    INTERNAL_COLUMNS = ['Sample_Key']
+    
+    # Formatos de Start_Time, en orden de prueba (%.f acepta fracciones de segundo opcionales)
+    TIME_FORMATS = ('%Y-%m-%d %H:%M:%S%.f', '%Y-%m-%dT%H:%M:%S%.f', '%Y-%m-%d')
+    # Day_of_Week se guarda como entero 0-6 (lunes a domingo); estos son sus nombres
+    DAYS_OF_WEEK = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+    # Horas pico de los días laborales como rangos [inicio, fin)
+    RUSH_HOURS = ((7, 10), (16, 19))
+    
+    # Tipos compactos en Pandas (incluye las columnas derivadas de Start_Time)
+    # Los enteros y booleanos con nulos se guardan con el tipo nullable equivalente (Int8, Int16, boolean)
+    PANDAS_DTYPES = {
+        'Start_Lat': 'float32',
+        'Start_Lng': 'float32',
+        'Temperature(F)': 'float32',
+        'Visibility(mi)': 'float32',
+        'Distance(mi)': 'float32',
+        'State': 'category',
+        'City': 'category',
+        'Weather_Condition': 'category',
+        'Severity': 'int8',
+        'Hour': 'int8',
+        'Day_of_Week': 'int8',
+        'Week': 'int8',
+        'Month': 'int8',
+        'Year': 'int16',
+        'Is_Weekend': 'bool',
+        'Is_Rush_Hour': 'bool',
+    }
+    
     def __init__(self):
         self.data_path = "us_accidents.csv"
+        self.cache_dir = Path(self.CACHE_DIR)
         self.df = None
         self.gdf = None
+        # Hashes ya calculados por (ruta, tamaño, fecha de modificación)
+        self._hash_cache = {}
+        # Plan serializado de cada consulta de scan_data -> clave persistente del dataset completo
+        self._scan_keys = {}
+        # Caché del proceso para datos cargados e índices/agregados derivados
+        self.cache = get_cache_manager()
+        # Cálculos de background_result en curso y los que fallaron (clave de caché -> future)
+        self._background = ThreadPoolExecutor(max_workers=self.BACKGROUND_WORKERS, thread_name_prefix='exacto')
+        self._pending = {}
+        self._failed = {}
+        self._pending_lock = threading.Lock()
     
     # Descargar dataset
-    @st.cache_data
-    def download_dataset(_self) -> str:
+    # Sin st.cache_data: fetch_dataset solo comprueba que el archivo exista, y así un error de
+    # descarga no queda cacheado ni se avisa de la falta de runtime en los scripts sin Streamlit
+    def download_dataset(self) -> str:
         with st.spinner("Descargando dataset desde Google Drive..."):
             try:
-                output_path = _self.data_path
-                
-                # Descargar solo si no existe
-                if not os.path.exists(output_path):
-                    gdown.download(_self.GDRIVE_URL, output_path, quiet=False)
-
-                return output_path
+                return self.fetch_dataset()
             except Exception as e:
                 st.error(f"❌ Error descargando dataset: {str(e)}")
                 return None
     
+    # Descargar el CSV solo si no existe (sin elementos de Streamlit: también lo usa loader.py)
+    # Se descarga a un archivo temporal y se renombra para que nadie lea un CSV a medias
+    def fetch_dataset(self) -> str:
+        if not os.path.exists(self.data_path):
+            import gdown
+            tmp_path = f"{self.data_path}.{os.getpid()}.{threading.get_ident()}.part"
+            if gdown.download(self.GDRIVE_URL, tmp_path, quiet=False) is None:
+                raise RuntimeError("gdown no pudo descargar el archivo")
+            os.replace(tmp_path, self.data_path)
+        return self.data_path
+    
+    # Hash SHA-256 del archivo fuente, memorizado mientras el archivo no cambie
+    # Los hashes se guardan también en la caché para que un proceso nuevo no relea el CSV
+    def _file_hash(self, path: str, chunk_size: int = 1 << 20) -> str:
+        stat = os.stat(path)
+        key = f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}"
+        hashes_file = self.cache_dir / "file_hashes.json"
+        if key not in self._hash_cache and hashes_file.exists():
+            self._hash_cache.update(json.loads(hashes_file.read_text()))
+        if key not in self._hash_cache:
+            sha = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(chunk_size), b''):
+                    sha.update(chunk)
+            self._hash_cache[key] = sha.hexdigest()
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp_path = hashes_file.with_suffix(f'.{os.getpid()}.tmp')
+            tmp_path.write_text(json.dumps(self._hash_cache))
+            os.replace(tmp_path, hashes_file)
+        return self._hash_cache[key]
+    
+    # Procesamiento de fechas y columnas derivadas en Polars (en paralelo, antes de pasar a Pandas)
+    # Cada formato de TIME_FORMATS se interpreta de forma explícita; los textos que no calzan con
+    # ninguno quedan nulos
+    @classmethod
+    def _add_time_columns(cls, df: pl.DataFrame) -> pl.DataFrame:
+        text = pl.col('Start_Time').cast(pl.String)
+        df = df.with_columns(pl.coalesce([
+            text.str.strptime(pl.Datetime('us'), fmt, strict=False) for fmt in cls.TIME_FORMATS
+        ]).alias('Start_Time'))
+        
+        start = pl.col('Start_Time')
+        hour = start.dt.hour().cast(pl.Int8)
+        weekday = (start.dt.weekday() - 1).cast(pl.Int8)
+        rush_hour = pl.any_horizontal([hour.is_between(a, b, closed='left') for a, b in cls.RUSH_HOURS])
+        return df.with_columns(
+            hour.alias('Hour'),
+            weekday.alias('Day_of_Week'),
+            start.dt.month().cast(pl.Int8).alias('Month'),
+            start.dt.year().cast(pl.Int16).alias('Year'),
+            start.dt.date().alias('Date'),
+            start.dt.week().cast(pl.Int8).alias('Week'),
+            (weekday >= 5).alias('Is_Weekend'),
+            ((weekday < 5) & rush_hour).alias('Is_Rush_Hour'),
+        )
+    
+    # Aplicar los tipos compactos del esquema
+    @classmethod
+    def _apply_compact_dtypes(cls, df: pd.DataFrame) -> pd.DataFrame:
+        for column, dtype in cls.PANDAS_DTYPES.items():
+            if column not in df.columns:
+                continue
+            if dtype == 'bool' and df[column].isna().any():
+                dtype = 'boolean'
+            elif isinstance(dtype, str) and dtype.startswith('int') and df[column].isna().any():
+                dtype = dtype.capitalize()
+            df[column] = df[column].astype(dtype)
+        return df
+    
+    # Leer del CSV solo las columnas del esquema que existan en el archivo
+    def _read_csv_projected(self, csv_file: str) -> pl.DataFrame:
+        schema = self._csv_schema(csv_file)
+        return pl.read_csv(csv_file, columns=list(schema), schema_overrides=schema)
+    
+    # Columnas de COLUMN_SCHEMA presentes en el CSV
+    def _csv_schema(self, csv_file: str) -> dict:
+        available = pl.read_csv(csv_file, n_rows=0).columns
+        return {column: dtype for column, dtype in self.COLUMN_SCHEMA.items() if column in available}
+    
+    # Leer las mismas columnas que _read_csv_projected por bloques de CSV_BLOCK_BYTES (lector de Arrow)
+    # Retorna pares (bloque, fracción aproximada del archivo leída) a medida que se interpretan
+    def _read_csv_chunks(self, csv_file: str):
+        schema = self._csv_schema(csv_file)
+        reader = pa_csv.open_csv(
+            csv_file,
+            read_options=pa_csv.ReadOptions(block_size=self.CSV_BLOCK_BYTES),
+            parse_options=pa_csv.ParseOptions(newlines_in_values=True),
+            # Como Polars: solo el campo vacío es nulo
+            convert_options=pa_csv.ConvertOptions(
+                include_columns=list(schema),
+                column_types={column: self.ARROW_TYPES.get(dtype, pa.string()) for column, dtype in schema.items()},
+                null_values=[''], strings_can_be_null=True, quoted_strings_can_be_null=False,
+            ),
+        )
+        size = max(os.path.getsize(csv_file), 1)
+        for i, batch in enumerate(reader, start=1):
+            yield pl.from_arrow(batch).cast(schema), min(i * self.CSV_BLOCK_BYTES / size, 1.0)
+    
+    # Clave de muestreo por fila: las filas con clave menor entran primero a las muestras
+    # Con estratificación, los primeros MIN_ROWS_PER_STRATUM de cada estrato van antes que el resto
+    # y luego cada estrato aporta en proporción a su tamaño
+    # seed: semilla de las claves (SAMPLE_SEED por defecto; cada lote de ingest.py usa la suya)
+    # uniform: solo claves uniformes en [0, 1), sin filas garantizadas. Los lotes de ingest.py se
+    # suman a estratos que ya tienen las suyas en el dataset base; con garantías propias, cada lote
+    # quedaría sobrerrepresentado en las muestras y en las fracciones del modo aproximado
+    def _sample_keys(self, df: pd.DataFrame, seed: Optional[int] = None, uniform: bool = False) -> np.ndarray:
+        rng = np.random.default_rng(self.SAMPLE_SEED if seed is None else seed)
+        u = rng.random(len(df))
+        strata_columns = [c for c in self.STRATA_COLUMNS if c in df.columns]
+        if uniform or not self.STRATIFY_SAMPLES or not strata_columns:
+            return u
+        
+        strata = df.groupby(strata_columns, observed=True, dropna=False, sort=False).ngroup().to_numpy()
+        # Posición de cada fila dentro de su estrato, en orden aleatorio
+        order = np.lexsort((u, strata))
+        sizes = np.bincount(strata)
+        starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+        rank_in_stratum = np.empty(len(df), dtype=np.int64)
+        rank_in_stratum[order] = np.arange(len(df)) - np.repeat(starts, sizes)
+        
+        proportional = (rank_in_stratum + u) / sizes[strata]
+        guaranteed = rank_in_stratum - self.MIN_ROWS_PER_STRATUM + u
+        return np.where(rank_in_stratum < self.MIN_ROWS_PER_STRATUM, guaranteed, proportional)
+    
+    # Convertir el CSV a Parquet una sola vez (versionado por el hash del CSV)
+    # on_chunk(bloque, fracción) se llama con cada bloque interpretado (progreso de la carga en segundo
+    # plano, que no usa elementos de Streamlit)
+    @profiled()
+    def build_columnar_cache(self, csv_file: str,
+                             on_chunk: Optional[Callable[[pl.DataFrame, float], None]] = None) -> str:
+        source_hash = self._file_hash(csv_file)
+        prefix = f"{Path(csv_file).stem}_v{self.CACHE_VERSION}_"
+        dataset_dir = self.cache_dir / f"{prefix}{source_hash[:16]}"
+        if dataset_dir.exists():
+            return str(dataset_dir)
+        
+        # El spinner solo dentro de la aplicación (no en la carga en segundo plano ni en los scripts de línea de comandos)
+        show_spinner = on_chunk is None and st.runtime.exists()
+        spinner = st.spinner("Convirtiendo CSV a formato columnar (solo la primera vez)...") if show_spinner else nullcontext()
+        with spinner:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            chunks = []
+            for chunk, fraction in self._read_csv_chunks(csv_file):
+                chunks.append(self._add_time_columns(chunk))
+                if on_chunk is not None:
+                    on_chunk(chunks[-1], fraction)
+            if not chunks:
+                chunks.append(self._add_time_columns(self._read_csv_projected(csv_file)))
+            df = self._apply_compact_dtypes(pl.concat(chunks).to_pandas())
+            df['Sample_Key'] = self._sample_keys(df)
+            
+            # Escribir en un directorio temporal y renombrar para no dejar cachés a medias
+            # (el nombre incluye el hilo: la carga en segundo plano puede convivir con otra conversión)
+            tmp_dir = dataset_dir.with_name(f"{dataset_dir.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            self.write_partitions(df, tmp_dir, dataset_dir.name)
+            try:
+                os.replace(tmp_dir, dataset_dir)
+            except OSError:
+                # Otro proceso terminó primero
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+        
+        # Eliminar cachés de versiones anteriores del mismo CSV (particiones y sus copias Arrow)
+        for old_path in self.cache_dir.glob(f"{Path(csv_file).stem}_v*"):
+            if not old_path.name.startswith(dataset_dir.name):
+                if old_path.is_dir():
+                    shutil.rmtree(old_path, ignore_errors=True)
+                else:
+                    old_path.unlink(missing_ok=True)
+        
+        return str(dataset_dir)
+    
+    # Escribir filas como particiones Year=/Month= bajo root, un archivo file_name.parquet por partición
+    # Los años o meses nulos van a la partición por defecto de Hive
+    def write_partitions(self, df: pd.DataFrame, root: Path, file_name: str) -> list:
+        paths = []
+        groups = df.groupby(self.PARTITION_COLUMNS, observed=True, dropna=False, sort=True)
+        for (year, month), partition in groups:
+            partition = partition.drop(columns=self.PARTITION_COLUMNS).sort_values(
+                ['State', 'Sample_Key'], kind='stable', ignore_index=True)
+            # State como texto plano: Parquet guarda min/max por row group para texto, no para categorías
+            partition['State'] = partition['State'].astype(object)
+            
+            year_dir = '__HIVE_DEFAULT_PARTITION__' if pd.isna(year) else int(year)
+            month_dir = '__HIVE_DEFAULT_PARTITION__' if pd.isna(month) else f"{int(month):02d}"
+            path = Path(root) / f"Year={year_dir}" / f"Month={month_dir}" / f"{file_name}.parquet"
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix('.parquet.tmp')
+            partition.to_parquet(tmp_path, compression='zstd', index=False,
+                                 row_group_size=self.PARQUET_ROW_GROUP_SIZE)
+            os.replace(tmp_path, path)
+            paths.append(str(path))
+        return paths
+    
+    # Archivos del dataset: las particiones de la copia columnar del CSV
+    # y las de los lotes incorporados con ingest.py
+    def dataset_files(self, csv_file: str) -> list:
+        dataset_dir = Path(self.build_columnar_cache(csv_file))
+        files = sorted(str(path) for path in dataset_dir.glob('Year=*/Month=*/*.parquet'))
+        batches = self.ingest_dir().glob('Year=*/Month=*/*.parquet')
+        return files + sorted(str(path) for path in batches)
+    
+    # Directorio de los lotes incorporados con el esquema de esta versión
+    def ingest_dir(self) -> Path:
+        return self.cache_dir / self.INGEST_DIR / f"v{self.CACHE_VERSION}"
+    
+    # Versión del dataset: la de la copia columnar más un resumen de los lotes incorporados
+    @staticmethod
+    def dataset_version(files: list) -> str:
+        version = Path(files[0]).stem
+        batches = [f for f in files if Path(f).stem != version]
+        if batches:
+            version += '+' + hashlib.sha1('|'.join(batches).encode('utf-8')).hexdigest()[:8]
+        return version
+    
+    # Consulta diferida sobre un conjunto de archivos del dataset
+    # Los filtros sobre Year y Month descartan archivos enteros; los de State, row groups
+    @classmethod
+    def scan_files(cls, files: list) -> pl.LazyFrame:
+        return pl.scan_parquet(files, hive_partitioning=True, hive_schema=cls.HIVE_SCHEMA)
+    
+    # Clave persistente de una muestra del dataset ("<versión>.<filas>") o del dataset completo
+    def dataset_key_for(self, files: list, n_rows: Optional[int] = None) -> str:
+        return f"{self.dataset_version(files)}.{n_rows or 'all'}"
+    
+    # Escribir las n_rows filas de menor Sample_Key (una muestra aleatoria estratificada),
+    # ya con los tipos compactos, como archivo Arrow IPC sin compresión (una sola vez por host)
+    def build_shared_prefix(self, files: list, n_rows: Optional[int]) -> str:
+        version = self.dataset_version(files)
+        arrow_path = self.cache_dir / f"{self.dataset_key_for(files, n_rows)}.arrow"
+        if arrow_path.exists():
+            return str(arrow_path)
+        
+        lf = self.scan_files(files)
+        if n_rows is not None:
+            # Umbral de clave que deja n_rows filas: solo se lee la columna Sample_Key
+            keys = lf.select('Sample_Key').collect()['Sample_Key'].to_numpy()
+            if n_rows < len(keys):
+                threshold = np.partition(keys, n_rows - 1)[n_rows - 1]
+                lf = lf.filter(pl.col('Sample_Key') <= threshold)
+        df_pl = lf.collect().sort('Sample_Key', maintain_order=True)
+        if n_rows is not None:
+            df_pl = df_pl.head(n_rows)
+        df = self._apply_compact_dtypes(df_pl.to_pandas())
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        
+        # Nombre temporal único por proceso: varios workers pueden construirlo a la vez
+        tmp_path = arrow_path.with_suffix(f'.arrow.{os.getpid()}.tmp')
+        with pa.OSFile(str(tmp_path), 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, arrow_path)
+        
+        # Eliminar las copias y artefactos de versiones anteriores
+        # (los procesos que aún mapean una copia anterior no se ven afectados)
+        for old_path in self.cache_dir.glob(f"{Path(files[0]).stem}*.arrow"):
+            if not old_path.name.startswith(f"{version}."):
+                old_path.unlink(missing_ok=True)
+        for old_dir in (self.cache_dir / self.ARTIFACTS_DIR).glob(f"{Path(files[0]).stem}*"):
+            if not old_dir.name.startswith(f"{version}."):
+                shutil.rmtree(old_dir, ignore_errors=True)
+        return str(arrow_path)
+    
+    # Mapear el prefijo en memoria (una vez por proceso)
+    # Las páginas del archivo las comparte el sistema operativo entre todos los procesos de la app;
+    # las columnas sin nulos y el texto se usan sin copiar (solo las que tienen nulos se materializan)
+    def _load_prefix(self, files: list, n_rows: Optional[int]) -> pd.DataFrame:
+        def map_prefix():
+            source = pa.memory_map(self.build_shared_prefix(files, n_rows))
+            table = pa.ipc.open_file(source).read_all()
+            # split_blocks evita consolidar columnas en bloques nuevos (lo que obligaría a copiarlas)
+            return table.to_pandas(split_blocks=True)
+        
+        return self.cache.get_or_compute(('prefix', self.dataset_version(files), n_rows), map_prefix)
+    
+    # Muestra de sample_size filas de los archivos del dataset (None = todas), sin elementos de Streamlit
+    # Las muestras de SAMPLE_TIERS se recortan de la mayor, que se lee una sola vez
+    def load_sample(self, files: list, sample_size: Optional[int] = None) -> pd.DataFrame:
+        if sample_size is not None and sample_size <= max(self.SAMPLE_TIERS):
+            base = self._load_prefix(files, max(self.SAMPLE_TIERS))
+        else:
+            base = self._load_prefix(files, sample_size)
+        df = base.iloc[:sample_size] if sample_size is not None and sample_size < len(base) else base
+        
+        # Identificador del dataset (se conserva en los DataFrames derivados por iloc/selección)
+        df.attrs['dataset_key'] = self.dataset_key_for(files, len(df))
+        return df
+    
     # Cargar datos
-    @st.cache_data
-    def load_data(_self, force_reload: bool = False, sample_size: Optional[int] = None) -> pd.DataFrame:
+    @profiled()
+    def load_data(self, sample_size: Optional[int] = None) -> pd.DataFrame:
         # Descargar dataset si no existe localmente
-        csv_file = _self.download_dataset()
+        csv_file = self.download_dataset()
         if csv_file is None:
             st.error("❌ Error: no se pudo descargar el archivo CSV")
             return None
         
         with st.spinner("Cargando dataset..."):
             try:
-                # Leer con Polars
-                df_pl = pl.read_csv(csv_file)
-                
-                # Disminuir tamaño si se especifica sample_size
-                if sample_size is not None and sample_size < len(df_pl):
-                    df_pl = df_pl.sample(n=sample_size, seed=42)
-                    st.warning(f"📊 Muestra tomada: {sample_size:,} registros para optimizar rendimiento")
+                # Leer la copia columnar y los lotes incorporados (las columnas de tiempo ya vienen derivadas)
+                files = self.dataset_files(csv_file)
+                total_rows = self.scan_files(files).select(pl.len()).collect().item()
+                df = self.load_sample(files, sample_size)
                 
-                # Convertir a Pandas para compatibilidad con GeoPandas y Streamlit
-                df = df_pl.to_pandas()
-                
-                # Procesamiento de fechas y columnas
-                df['Start_Time'] = pd.to_datetime(df['Start_Time'], errors='coerce')
-                df['Hour'] = df['Start_Time'].dt.hour
-                df['Day_of_Week'] = df['Start_Time'].dt.day_name()
-                df['Month'] = df['Start_Time'].dt.month
-                df['Year'] = df['Start_Time'].dt.year
+                if len(df) < total_rows:
+                    st.warning(f"📊 Muestra estratificada: {len(df):,} de {total_rows:,} registros para optimizar rendimiento")
                 
                 st.success(f"✅ Dataset procesado: {len(df):,} registros de {df['State'].nunique()} estados")
                 return df
@@ -76,67 +465,447 @@ class DataManager:
                 st.error(f"Error cargando dataset: {str(e)}")
                 return None
 
-    # Crear GeoDataFrame
-    @st.cache_data
-    def create_geodataframe(_self, df: pd.DataFrame) -> gpd.GeoDataFrame:
+    # Consulta diferida sobre los archivos del dataset, registrada para leer sus artefactos
+    # persistidos (sin elementos de Streamlit)
+    def scan_dataset(self, files: list) -> pl.LazyFrame:
+        lf = self.scan_files(files)
+        self._scan_keys[self._dataset_key(lf)] = self.dataset_key_for(files)
+        return lf
+    
+    # Consulta diferida sobre el dataset completo (sin muestreo ni conversión a Pandas)
+    # Los filtros y agregaciones se empujan al motor de Polars y solo se recolectan resultados
+    @profiled()
+    def scan_data(self) -> Optional[pl.LazyFrame]:
+        csv_file = self.download_dataset()
+        if csv_file is None:
+            st.error("❌ Error: no se pudo descargar el archivo CSV")
+            return None
+        
+        try:
+            return self.scan_dataset(self.dataset_files(csv_file))
+        except Exception as e:
+            st.error(f"Error preparando consulta del dataset: {str(e)}")
+            return None
+    
+    # Crear GeoDataFrame (bajo demanda: GeoPandas solo se importa al pedirlo)
+    def create_geodataframe(self, df: pd.DataFrame) -> "gpd.GeoDataFrame":
         if df is None or df.empty:
             return None
         
         try:
-            gdf = gpd.GeoDataFrame(
+            import geopandas as gpd
+            
+            return self._cached('geodataframe', df, lambda: gpd.GeoDataFrame(
                 df,
                 geometry=gpd.points_from_xy(df['Start_Lng'], df['Start_Lat']),
                 crs="EPSG:4326"
-            )
-            return gdf
+            ))
         except Exception as e:
             st.error(f"Error creando GeoDataFrame: {str(e)}")
             return None
     
-    # Resumen de datos
-    def get_data_summary(self, df: pd.DataFrame) -> dict:
-        if df is None or df.empty:
+    # Identificador de un DataFrame para la caché: (versión y muestra del dataset, firma de filtros)
+    def frame_key(self, df: Union[pd.DataFrame, pl.LazyFrame]) -> tuple:
+        if qe.is_lazy(df):
+            return (self._dataset_key(df), '')
+        return (self._dataset_key(df), df.attrs.get('filter_signature', '{}'))
+    
+    # Calcular un artefacto derivado de un DataFrame o recuperarlo de la caché del proceso
+    def _cached(self, name, df: Union[pd.DataFrame, pl.LazyFrame], compute):
+        return self.cache.get_or_compute((name,) + self.frame_key(df), compute)
+    
+    # Resultado de una función pura del DataFrame, cacheado por (nombre, dataset, firma de filtros)
+    # `name` debe incluir los demás parámetros de la función; las vistas lo usan para no
+    # recalcular figuras y capas cuyas entradas no cambiaron
+    def cached_result(self, name: tuple, df: Union[pd.DataFrame, pl.LazyFrame], compute):
+        return self._cached(name, df, compute)
+    
+    # Como cached_result, pero calculando en un hilo de fondo: retorna None mientras no termina
+    # (el modo aproximado muestra estimaciones hasta entonces); un error se relanza una sola vez
+    # pending: lista de la sesión a la que se agrega la clave del cálculo si sigue en curso
+    def background_result(self, name: tuple, df: Union[pd.DataFrame, pl.LazyFrame], compute,
+                          pending: Optional[list] = None):
+        key = (name,) + self.frame_key(df)
+        value = self.cache.get(key)
+        if value is not None:
+            return value
+        with self._pending_lock:
+            if key in self._failed:
+                raise self._failed.pop(key).exception()
+            future = self._pending.get(key)
+            if future is None:
+                future = self._pending[key] = self._background.submit(compute)
+                future.add_done_callback(lambda done: self._collect_background(key, done))
+        # Terminado pero aún sin guardar en la caché (el callback corre después de despertar a wait)
+        if future.done() and future.exception() is None:
+            return future.result()
+        if pending is not None and key not in pending:
+            pending.append(key)
+        return None
+    
+    # Al terminar un cálculo de fondo: guardar el resultado en la caché (o el error)
+    def _collect_background(self, key, future):
+        if future.exception() is None:
+            self.cache.put(key, future.result())
+        with self._pending_lock:
+            self._pending.pop(key, None)
+            if future.exception() is not None:
+                self._failed[key] = future
+    
+    # Esperar hasta `timeout` segundos los cálculos de fondo de `keys` (las claves que
+    # background_result agregó a `pending`); retorna las que siguen en curso
+    def wait_background(self, keys: list, timeout: Optional[float] = None) -> list:
+        with self._pending_lock:
+            futures = {key: self._pending[key] for key in keys if key in self._pending}
+        if futures:
+            wait(futures.values(), timeout=timeout)
+        return [key for key, future in futures.items() if not future.done()]
+    
+    # Clave persistente de un dataset sin filtrar (muestra o completo); None si está filtrado
+    def artifact_key(self, df: Union[pd.DataFrame, pl.LazyFrame]) -> Optional[str]:
+        if qe.is_lazy(df):
+            return self._scan_keys.get(self._dataset_key(df))
+        if df.attrs.get('filter_signature', '{}') != '{}':
+            return None
+        return df.attrs.get('dataset_key')
+    
+    # Cantidad de registros (una vez por dataset o selección filtrada)
+    def count_rows(self, df: Union[pd.DataFrame, pl.LazyFrame]) -> int:
+        return self.cached_result(('count',), df, lambda: qe.count_rows(df))
+    
+    # Ruta de un artefacto persistido
+    def artifact_path(self, key: str, name: str) -> Path:
+        return self.cache_dir / self.ARTIFACTS_DIR / key / name
+    
+    # Como _cached, pero leyendo el artefacto de disco si ya se calculó (aquí o con precompute.py)
+    # y guardándolo al calcularlo; las selecciones filtradas solo se cachean en memoria
+    def _persisted(self, name: str, df: Union[pd.DataFrame, pl.LazyFrame], compute, save, load):
+        key = self.artifact_key(df)
+        if key is None:
+            return self._cached(name, df, compute)
+        
+        def load_or_compute():
+            path = self.artifact_path(key, name)
+            if path.exists():
+                return load(path)
+            value = compute()
+            save(value, path)
+            return value
+        
+        return self._cached(name, df, load_or_compute)
+    
+    # Guardar un artefacto en JSON (escritura atómica)
+    @staticmethod
+    def _save_json(value, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f'.{os.getpid()}.tmp')
+        tmp_path.write_text(json.dumps(value))
+        os.replace(tmp_path, path)
+    
+    # Guardar un DataFrame de artefactos (escritura atómica)
+    @staticmethod
+    def _save_frame(frame: pd.DataFrame, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f'.{os.getpid()}.tmp')
+        frame.to_parquet(tmp_path)
+        os.replace(tmp_path, path)
+    
+    # Resumen de datos: todas las métricas de summary.METRICS en una sola pasada
+    # El estado parcial se cachea por (dataset, firma de filtros) y, sin filtros, se persiste
+    # como artefacto (ingest.py lo actualiza sumando solo el lote nuevo)
+    @profiled()
+    def get_data_summary(self, df: Union[pd.DataFrame, pl.LazyFrame]) -> dict:
+        if df is None:
             return {}
         
-        summary = {
-            'total_accidents': len(df),
-            'date_range': f"{df['Start_Time'].min().strftime('%Y-%m-%d')} a {df['Start_Time'].max().strftime('%Y-%m-%d')}",
-            'states_count': df['State'].nunique(),
-            'cities_count': df['City'].nunique(),
-            'severity_distribution': df['Severity'].value_counts().to_dict(),
-            'most_common_weather': df['Weather_Condition'].value_counts().head().to_dict(),
-            'avg_temperature': round(df['Temperature(F)'].mean(), 2) if 'Temperature(F)' in df.columns else 'N/A'
-        }
+        states = self._persisted('summary.json', df, lambda: summary.compute_states(df),
+                                 self._save_json, lambda path: json.loads(path.read_text()))
+        return self._format_summary(summary.finalize(states))
+    
+    # Resumen estimado con la fracción `fraction` del dataset completo (modo aproximado)
+    # Agrega 'sample_rows' (filas de la muestra) y 'margins' (semiancho del IC 95% por métrica)
+    @profiled()
+    def get_approximate_summary(self, df: pl.LazyFrame, fraction: float) -> dict:
+        values = self._cached(('approximate_summary', fraction), df,
+                              lambda: approximate.estimate_summary(df, fraction, self.get_strata_sizes(df)))
+        return self._format_summary(dict(values))
+    
+    # Rango de fechas legible y temperatura 'N/A' si falta (el resumen vacío es {})
+    @staticmethod
+    def _format_summary(values: dict) -> dict:
+        if not values['total_accidents']:
+            return {}
+        
+        start_min, start_max = values.get('start_min'), values.get('start_max')
+        values['date_range'] = f"{start_min:%Y-%m-%d} a {start_max:%Y-%m-%d}" if start_min else 'N/A'
+        if values.get('avg_temperature') is None:
+            values['avg_temperature'] = 'N/A'
+        return values
+    
+    # Memoria por columna comparada con los tipos por defecto (64 bits / object)
+    def get_memory_report(self, df: pd.DataFrame) -> pd.DataFrame:
+        rows = []
+        for column in df.columns:
+            series = df[column]
+            current = int(series.memory_usage(deep=True, index=False))
+            if pd.api.types.is_datetime64_any_dtype(series):
+                original = current
+            elif pd.api.types.is_numeric_dtype(series) and not isinstance(series.dtype, pd.CategoricalDtype):
+                original = 8 * len(series)
+            else:
+                original = int(series.astype(object).memory_usage(deep=True, index=False))
+            rows.append({
+                'Columna': column,
+                'Tipo': str(series.dtype),
+                'Bytes_Original': original,
+                'Bytes_Actual': current,
+                'Bytes_Ahorrados': original - current,
+            })
+        
+        report = pd.DataFrame(rows)
+        report['Ahorro_%'] = (100 * report['Bytes_Ahorrados'] / report['Bytes_Original'].where(report['Bytes_Original'] > 0)).round(1)
+        return report
+    
+    # Índice de filtros compartido entre reruns y sesiones (se construye una vez por dataset)
+    @profiled()
+    def build_filter_index(self, df: pd.DataFrame) -> FilterIndex:
+        return self._cached('filter_index', df, lambda: FilterIndex(df))
+    
+    # Cubo de conteos para los gráficos (una vez por dataset, en memoria o diferido)
+    @profiled()
+    def build_aggregation_cube(self, df: Union[pd.DataFrame, pl.LazyFrame]) -> AggregationCube:
+        return self._persisted('cube.parquet', df, lambda: AggregationCube.from_frame(df),
+                               lambda cube, path: cube.save(str(path)),
+                               lambda path: AggregationCube.load(str(path)))
+    
+    # Cubo estimado con la fracción `fraction` del dataset completo (modo aproximado)
+    @profiled()
+    def build_approximate_cube(self, df: pl.LazyFrame, fraction: float) -> approximate.ApproximateCube:
+        return self._cached(('approximate_cube', fraction), df,
+                            lambda: approximate.ApproximateCube.from_sample(df, fraction, self.get_strata_sizes(df)))
+    
+    # Filas del dataset por estrato de muestreo (pesos de las estimaciones del modo aproximado)
+    @profiled()
+    def get_strata_sizes(self, df: pl.LazyFrame) -> pd.DataFrame:
+        columns = qe.column_names(df)
+        strata = [c for c in self.STRATA_COLUMNS if self.STRATIFY_SAMPLES and c in columns]
+        return self._cached('strata_sizes', df, lambda: approximate.strata_sizes(df, strata))
+    
+    # Celdas del mapa a la resolución más fina (conteo y suma de severidad)
+    # Se persisten así, y no como capas, para que ingest.py les sume las de un lote nuevo
+    @profiled()
+    def build_spatial_cells(self, df: Union[pd.DataFrame, pl.LazyFrame]) -> pd.DataFrame:
+        return self._persisted('spatial_cells.parquet', df, lambda: spatial.grid_cells(df),
+                               self._save_frame, pd.read_parquet)
+    
+    # Celdas del mapa agregado en todas las resoluciones de spatial.GRID_RESOLUTIONS
+    @profiled()
+    def build_spatial_bins(self, df: Union[pd.DataFrame, pl.LazyFrame]) -> dict:
+        return self._cached('spatial_bins', df, lambda: spatial.pyramid_from_cells(self.build_spatial_cells(df)))
+    
+    # Índice espacial de los puntos (una vez por dataset o selección filtrada)
+    @profiled()
+    def build_spatial_index(self, df: pd.DataFrame) -> spatial.SpatialIndex:
+        return self._cached('spatial_index', df, lambda: spatial.SpatialIndex(df['Start_Lat'], df['Start_Lng']))
+    
+    # Tabla de agregados por región (State o City) con pares suma/cantidad (una vez por dataset)
+    @profiled()
+    def build_region_aggregates(self, df: Union[pd.DataFrame, pl.LazyFrame], level: str = 'State') -> RegionAggregates:
+        return self._persisted(f'region_aggregates_{level.lower()}.parquet', df,
+                               lambda: RegionAggregates.from_frame(df, level),
+                               lambda regions, path: regions.save(str(path)),
+                               lambda path: RegionAggregates.load(str(path)))
+    
+    # Cantidad y promedios por estado (mapa choropleth y centros de los estados)
+    # df es el dataset sin filtrar: los filtros se resuelven sobre la tabla de regiones
+    @profiled()
+    def get_state_summary(self, df: Union[pd.DataFrame, pl.LazyFrame], filters: Optional[dict] = None) -> pd.DataFrame:
+        return self.build_region_aggregates(df).query(**(filters or {}))
+    
+    # Cantidad y promedios por ciudad, de mayor a menor cantidad (el clima no se puede filtrar)
+    @profiled()
+    def get_city_summary(self, df: Union[pd.DataFrame, pl.LazyFrame], filters: Optional[dict] = None,
+                         top: Optional[int] = None) -> pd.DataFrame:
+        if 'City' not in qe.column_names(df):
+            return pd.DataFrame()
+        cities = self.build_region_aggregates(df, 'City').query(**(filters or {}))
+        cities = cities.sort_values('count', ascending=False, kind='stable')
+        return cities.head(top) if top else cities
+    
+    # Puntos dentro de los límites (lat_min, lat_max, lng_min, lng_max), reducidos a `budget`
+    # Retorna los puntos y la cantidad total que hay en la vista
+    @profiled()
+    def get_viewport_points(self, df: Union[pd.DataFrame, pl.LazyFrame], bounds: tuple,
+                            budget: int, columns: list) -> Tuple[pd.DataFrame, int]:
+        lat_min, lat_max, lng_min, lng_max = bounds
+        if qe.is_lazy(df):
+            in_view = df.filter(
+                pl.col('Start_Lat').is_between(lat_min, lat_max) &
+                pl.col('Start_Lng').is_between(lng_min, lng_max)
+            )
+            return qe.sample_rows(in_view, budget, columns), qe.count_rows(in_view)
         
-        return summary
+        rows, total = self.build_spatial_index(df).query(lat_min, lat_max, lng_min, lng_max, budget)
+        return df[columns].iloc[rows], total
+    
+    # Valores disponibles para un filtro con su cantidad de registros
+    @profiled()
+    def get_filter_options(self, df: Union[pd.DataFrame, pl.LazyFrame], column: str) -> pd.Series:
+        if qe.is_lazy(df):
+            return self._cached(('filter_options', column), df, lambda: qe.value_counts(df, column))
+        return self.build_filter_index(df).value_counts(column)
+    
+    # Posiciones de las filas que cumplen los filtros (None = todas)
+    def filter_rows(self, df: pd.DataFrame, **filters) -> Optional[np.ndarray]:
+        return self.build_filter_index(df).select(**filters)
+    
+    # Orden de una columna para paginar la tabla (compartido por todas las combinaciones de filtros)
+    # Cada columna es una entrada propia de la caché: su arreglo de rangos cuenta en el presupuesto
+    @profiled()
+    def build_sort_index(self, df: pd.DataFrame, column: str) -> SortIndex:
+        return self._cached(('sort_index', column), df, lambda: SortIndex(df[column]))
+    
+    # Una página de los datos filtrados, ordenada por `sort_column` (None = orden original)
+    @profiled()
+    def get_table_page(self, df: Union[pd.DataFrame, pl.LazyFrame], filters: dict, columns: list,
+                       sort_column: Optional[str], ascending: bool, page: int, page_size: int) -> pd.DataFrame:
+        if qe.is_lazy(df):
+            query = self._filter_lazy_data(df, **filters).select(columns)
+            if sort_column is not None:
+                # sort + slice se resuelve en Polars como una selección top-k
+                query = query.sort(sort_column, descending=not ascending, nulls_last=True, maintain_order=True)
+            return query.slice(page * page_size, page_size).collect().to_pandas()
+        
+        rows = self.filter_rows(df, **filters)
+        if sort_column is None:
+            start = page * page_size
+            positions = np.arange(start, min(start + page_size, len(df))) if rows is None else rows[start:start + page_size]
+        else:
+            positions = self.build_sort_index(df, sort_column).page(rows, ascending, page, page_size)
+        return df[columns].iloc[positions]
     
     # Filtros de datos
-    def filter_data(self, df: pd.DataFrame, **filters) -> pd.DataFrame:
+    # Sin filtros activos se retorna el mismo DataFrame, sin copiarlo
+    # El resultado se cachea por (dataset, firma de filtros) y queda marcado con su firma
+    @profiled()
+    def filter_data(self, df: Union[pd.DataFrame, pl.LazyFrame], **filters) -> Union[pd.DataFrame, pl.LazyFrame]:
+        if qe.is_lazy(df):
+            return self._filter_lazy_data(df, **filters)
+        
         if df is None or df.empty:
             return df
         
-        filtered_df = df.copy()
+        signature = self.filter_signature(filters)
+        if signature == '{}':
+            return df
         
-        # Filtro por severidad
-        if 'severity' in filters and filters['severity']:
-            filtered_df = filtered_df[filtered_df['Severity'].isin(filters['severity'])]
+        def apply_filters():
+            filtered_df = df.iloc[self.filter_rows(df, **filters)]
+            base_signature = df.attrs.get('filter_signature', '{}')
+            filtered_df.attrs['filter_signature'] = signature if base_signature == '{}' else f"{base_signature}&{signature}"
+            return filtered_df
         
-        # Filtro por estado
-        if 'states' in filters and filters['states']:
-            filtered_df = filtered_df[filtered_df['State'].isin(filters['states'])]
+        return self._cached(('filtered', signature), df, apply_filters)
+    
+    # Firma estable de una combinación de filtros
+    @staticmethod
+    def filter_signature(filters: dict) -> str:
+        active = {name: sorted(map(str, values)) for name, values in filters.items() if values}
+        return json.dumps(active, sort_keys=True)
+    
+    # Identificador del dataset de origen
+    @staticmethod
+    def _dataset_key(df: Union[pd.DataFrame, pl.LazyFrame]) -> str:
+        if qe.is_lazy(df):
+            return hashlib.sha1(df.serialize()).hexdigest()
+        if 'dataset_key' in df.attrs:
+            return df.attrs['dataset_key']
+        return str(pd.util.hash_pandas_object(df, index=False).sum())
+    
+    # Ruta de la exportación para un dataset, filtros y formato ('csv' o 'parquet')
+    # (las columnas exportadas son parte de la clave: un cambio en ellas no reutiliza archivos anteriores)
+    def export_path(self, df: Union[pd.DataFrame, pl.LazyFrame], filters: dict, fmt: str) -> Path:
+        key = f"{self._dataset_key(df)}|{self.filter_signature(filters)}|{','.join(self.export_columns(df))}"
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+        return self.cache_dir / self.EXPORT_DIR / f"accidentes_{digest}.{fmt}"
+    
+    # Columnas que se exportan (todas menos las internas)
+    def export_columns(self, df: Union[pd.DataFrame, pl.LazyFrame]) -> list:
+        return [c for c in qe.column_names(df) if c not in self.INTERNAL_COLUMNS]
+    
+    # Exportar los datos filtrados bajo demanda, escribiendo por bloques
+    # Si la misma combinación ya se exportó, se reutiliza el archivo
+    @profiled()
+    def export_data(self, df: Union[pd.DataFrame, pl.LazyFrame], filters: dict, fmt: str = 'csv') -> str:
+        path = self.export_path(df, filters, fmt)
+        if path.exists():
+            return str(path)
         
-        # Filtro por año
-        if 'years' in filters and filters['years']:
-            filtered_df = filtered_df[filtered_df['Year'].isin(filters['years'])]
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Un temporal por proceso e hilo: dos exportaciones simultáneas no escriben el mismo archivo
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        columns = self.export_columns(df)
+        if qe.is_lazy(df):
+            # Polars procesa la consulta en streaming sin materializarla completa
+            if fmt == 'parquet':
+                df.select(columns).sink_parquet(tmp_path, compression='zstd')
+            else:
+                df.select(columns).sink_csv(tmp_path)
+        elif fmt == 'parquet':
+            self._write_parquet_chunks(df, columns, tmp_path)
+        else:
+            self._write_csv_chunks(df, columns, tmp_path)
+        os.replace(tmp_path, path)
         
-        # Filtro por condición climática
-        if 'weather' in filters and filters['weather']:
-            filtered_df = filtered_df[filtered_df['Weather_Condition'].isin(filters['weather'])]
+        # Conservar solo las exportaciones terminadas más recientes (los temporales en curso no se tocan)
+        exports = [p for p in path.parent.glob('accidentes_*') if p.suffix in ('.csv', '.parquet')]
+        exports.sort(key=lambda p: p.stat().st_mtime, reverse=True)
+        for old_path in exports[self.EXPORT_MAX_FILES:]:
+            old_path.unlink(missing_ok=True)
         
-        return filtered_df
+        return str(path)
+    
+    # Las columnas se seleccionan por bloque para no copiar el DataFrame completo
+    def _write_csv_chunks(self, df: pd.DataFrame, columns: list, path: Path):
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            if df.empty:
+                df.head(0)[columns].to_csv(f, index=False)
+            for start in range(0, len(df), self.EXPORT_CHUNK_ROWS):
+                df.iloc[start:start + self.EXPORT_CHUNK_ROWS][columns].to_csv(f, index=False, header=start == 0)
+    
+    def _write_parquet_chunks(self, df: pd.DataFrame, columns: list, path: Path):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        
+        schema = pa.Schema.from_pandas(df.head(0)[columns], preserve_index=False)
+        with pq.ParquetWriter(path, schema, compression='zstd') as writer:
+            for start in range(0, len(df), self.EXPORT_CHUNK_ROWS):
+                chunk = df.iloc[start:start + self.EXPORT_CHUNK_ROWS][columns]
+                writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+    
+    # Filtros como predicados de Polars (se aplican al leer el archivo)
+    def _filter_lazy_data(self, lf: pl.LazyFrame, **filters) -> pl.LazyFrame:
+        columns = {
+            'severity': 'Severity',
+            'states': 'State',
+            'years': 'Year',
+            'weather': 'Weather_Condition',
+        }
+        for key, column in columns.items():
+            if filters.get(key):
+                lf = lf.filter(pl.col(column).is_in(list(filters[key])))
+        return lf
+
+
+_data_manager = None
+_data_manager_lock = threading.Lock()
 
 
-# Función para inicializar el gestor de datos
-@st.cache_resource
-def get_data_manager():
-    return DataManager()
\ No newline at end of file
+# Gestor de datos único del proceso (como get_cache_manager: sin st.cache_resource, porque también
+# lo usa el hilo de carga en segundo plano, que no tiene contexto de Streamlit)
+def get_data_manager() -> DataManager:
+    global _data_manager
+    with _data_manager_lock:
+        if _data_manager is None:
+            _data_manager = DataManager()
+        return _data_manager
\ No newline at end of file
@@ -0,0 +1,136 @@
+"""
+Índices en memoria para la tabla interactiva
+FilterIndex: índice invertido sobre las dimensiones de filtro de baja cardinalidad. Para cada valor
+se guardan sus filas como un arreglo ordenado de posiciones, de modo que un filtro cuesta en
+proporción a las filas seleccionadas y no al DataFrame completo
+SortIndex: orden precalculado de una columna para paginar resultados filtrados
+"""
+
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+
+class FilterIndex:
+    # Nombre del filtro (como en DataManager.filter_data) -> columna indexada
+    DIMENSIONS = {
+        'states': 'State',
+        'severity': 'Severity',
+        'years': 'Year',
+        'weather': 'Weather_Condition',
+    }
+
+    def __init__(self, df: pd.DataFrame):
+        self.n_rows = len(df)
+        # Por columna: código de cada fila (-1 = nulo), valor -> código,
+        # filas agrupadas por código y posición donde empieza cada código
+        self._codes: Dict[str, np.ndarray] = {}
+        self._lookup: Dict[str, dict] = {}
+        self._rows: Dict[str, np.ndarray] = {}
+        self._offsets: Dict[str, np.ndarray] = {}
+        self._counts: Dict[str, pd.Series] = {}
+
+        for column in self.DIMENSIONS.values():
+            if column in df.columns:
+                self._build(column, df[column])
+
+    # Construir las listas de filas de una columna
+    def _build(self, column: str, series: pd.Series):
+        codes, uniques = pd.factorize(series, use_na_sentinel=True)
+        codes = codes.astype(np.int32)
+        values = list(uniques.tolist())
+
+        # Orden estable: dentro de cada valor las filas quedan en orden ascendente
+        rows = np.argsort(codes, kind='stable').astype(np.int32)
+        counts = np.bincount(codes[codes >= 0], minlength=len(values))
+        n_nulls = int((codes < 0).sum())
+        offsets = n_nulls + np.concatenate(([0], np.cumsum(counts)))
+
+        self._codes[column] = codes
+        self._lookup[column] = {value: code for code, value in enumerate(values)}
+        self._rows[column] = rows
+        self._offsets[column] = offsets
+        value_counts = pd.Series(counts, index=pd.Index(values, name=column), name='count')
+        self._counts[column] = value_counts.sort_values(ascending=False, kind='stable')
+
+    # Conteo por valor (equivalente a value_counts, sin recorrer las filas)
+    def value_counts(self, column: str) -> pd.Series:
+        return self._counts[column]
+
+    # Códigos internos de los valores seleccionados (los valores desconocidos se ignoran)
+    def _selected_codes(self, column: str, values) -> np.ndarray:
+        lookup = self._lookup[column]
+        return np.array(sorted({lookup[v] for v in values if v in lookup}), dtype=np.int32)
+
+    # Filas de un conjunto de códigos, en orden ascendente
+    def _rows_for(self, column: str, codes: np.ndarray) -> np.ndarray:
+        offsets, rows = self._offsets[column], self._rows[column]
+        parts = [rows[offsets[c]:offsets[c + 1]] for c in codes]
+        if not parts:
+            return np.empty(0, dtype=np.int32)
+        if len(parts) == 1:
+            return parts[0]
+        return np.sort(np.concatenate(parts))
+
+    # Posiciones de las filas que cumplen todos los filtros
+    # Retorna None si no hay filtros activos (todas las filas)
+    def select(self, **filters) -> Optional[np.ndarray]:
+        active = []
+        for name, column in self.DIMENSIONS.items():
+            values = filters.get(name)
+            if values and column in self._codes:
+                codes = self._selected_codes(column, values)
+                size = int(sum(self._offsets[column][c + 1] - self._offsets[column][c] for c in codes))
+                active.append((size, column, codes))
+
+        if not active:
+            return None
+
+        # Partir del filtro más selectivo y verificar los demás solo sobre esas filas
+        active.sort(key=lambda item: item[0])
+        _, column, codes = active[0]
+        rows = self._rows_for(column, codes)
+        for _, column, codes in active[1:]:
+            if len(rows) == 0:
+                break
+            rows = rows[np.isin(self._codes[column][rows], codes)]
+        return rows
+
+
+# Orden global de una columna para paginar la tabla
+# La columna se ordena una sola vez (rango de cada fila); una página de cualquier subconjunto
+# filtrado se obtiene con una selección parcial (top-k) sobre esos rangos
+class SortIndex:
+    # Rango de cada fila según los valores (los nulos quedan al final)
+    def __init__(self, values: pd.Series):
+        values = values.reset_index(drop=True)
+        # Las categorías sin orden se ordenan alfabéticamente, como texto
+        if isinstance(values.dtype, pd.CategoricalDtype) and not values.dtype.ordered:
+            values = values.astype(object)
+        order = values.sort_values(kind='stable', na_position='last').index.to_numpy()
+        self.ranks = np.empty(len(order), dtype=np.int64)
+        self.ranks[order] = np.arange(len(order))
+        self.n_valid = int(values.notna().sum())
+
+    # Posiciones de las filas de una página
+    # rows: filas filtradas (None = todas)
+    def page(self, rows: Optional[np.ndarray], ascending: bool, page: int, page_size: int) -> np.ndarray:
+        if rows is None:
+            rows = np.arange(len(self.ranks))
+        start, end = page * page_size, min((page + 1) * page_size, len(rows))
+        if start >= end:
+            return np.empty(0, dtype=np.int64)
+
+        keys = self.ranks[rows]
+        if not ascending:
+            # Invertir el orden manteniendo los nulos al final
+            keys = np.where(keys < self.n_valid, self.n_valid - 1 - keys, keys)
+
+        # Solo se ordenan las primeras `end` filas (top-k), no todo el subconjunto
+        if end < len(keys):
+            top = np.argpartition(keys, end - 1)[:end]
+        else:
+            top = np.arange(len(keys))
+        top = top[np.argsort(keys[top], kind='stable')]
+        return rows[top[start:end]]
@@ -0,0 +1,162 @@
+"""
+Ingesta incremental de lotes nuevos de accidentes
+Cada CSV se valida, se deduplica por ID y se guarda como particiones Parquet Year=/Month=
+junto a la copia columnar del dataset; el cubo de conteos, las tablas de regiones, las celdas del
+mapa y el resumen del dataset completo se actualizan sumando solo el lote, sin volver a recorrer el histórico
+
+Uso:
+    python ingest.py lote_2024_01.csv [lote_2024_02.csv ...]
+"""
+
+import argparse
+import json
+
+import pandas as pd
+import polars as pl
+
+import spatial
+import summary
+from aggregation_cube import AggregationCube
+from region_aggregates import RegionAggregates
+from data_manager import DataManager
+
+# Columnas sin las cuales un registro no se puede usar en la aplicación
+REQUIRED_COLUMNS = ['ID', 'Start_Time', 'Start_Lat', 'Start_Lng', 'State', 'Severity']
+SEVERITY_RANGE = (1, 4)
+
+
+# Leer el lote con el esquema del dataset; las columnas opcionales ausentes quedan nulas
+def read_batch(data_manager: DataManager, csv_file: str) -> pd.DataFrame:
+    df_pl = data_manager._read_csv_projected(csv_file)
+    missing = [c for c in REQUIRED_COLUMNS if c not in df_pl.columns]
+    if missing:
+        raise ValueError(f"Faltan columnas obligatorias en {csv_file}: {', '.join(missing)}")
+    df_pl = df_pl.with_columns(
+        pl.lit(None, dtype=dtype).alias(column)
+        for column, dtype in data_manager.COLUMN_SCHEMA.items() if column not in df_pl.columns
+    ).select(list(data_manager.COLUMN_SCHEMA))
+    return data_manager._add_time_columns(df_pl).to_pandas()
+
+
+# Descartar registros inválidos y duplicados dentro del lote
+# Retorna el lote limpio, la cantidad de registros inválidos y la de IDs repetidos
+def validate_batch(df: pd.DataFrame) -> tuple:
+    valid = (
+        df['ID'].notna()
+        & df['Start_Time'].notna()
+        & df['Start_Lat'].between(-90, 90)
+        & df['Start_Lng'].between(-180, 180)
+        & df['State'].notna()
+        & df['Severity'].between(*SEVERITY_RANGE)
+    )
+    clean = df[valid].drop_duplicates('ID', keep='first')
+    return clean.reset_index(drop=True), int((~valid).sum()), int(valid.sum()) - len(clean)
+
+
+# Quitar los IDs que ya existen en el dataset
+# Solo se leen la columna ID y las particiones de los meses que toca el lote
+def drop_existing_ids(data_manager: DataManager, files: list, df: pd.DataFrame) -> tuple:
+    if df.empty:
+        return df, 0
+    months = df[['Year', 'Month']].drop_duplicates()
+    existing = (
+        data_manager.scan_files(files)
+        .filter(
+            pl.col('Year').is_in(months['Year'].tolist())
+            & pl.col('Month').is_in(months['Month'].tolist())
+            & pl.col('ID').is_in(df['ID'].tolist())
+        )
+        .select('ID')
+        .collect()['ID']
+        .to_list()
+    )
+    duplicated = df['ID'].isin(existing)
+    return df[~duplicated].reset_index(drop=True), int(duplicated.sum())
+
+
+# Sumar el lote al cubo, a las tablas de regiones, a las celdas del mapa y al resumen persistidos del dataset anterior y guardarlos para la nueva versión
+# (los artefactos de la versión anterior se eliminan cuando la aplicación carga la nueva)
+def fold_aggregates(data_manager: DataManager, old_files: list, new_files: list, df: pd.DataFrame):
+    old_key = data_manager.dataset_key_for(old_files)
+    new_key = data_manager.dataset_key_for(new_files)
+    old_path = data_manager.artifact_path(old_key, 'cube.parquet')
+    try:
+        if not old_path.exists():
+            raise FileNotFoundError(old_path)
+        cube = AggregationCube.load(str(old_path))
+        cube = cube.merge(AggregationCube.from_frame(df, temperature_edges=cube.temperature_edges))
+    except (FileNotFoundError, ValueError):
+        # Sin cubo previo compatible: se construye una vez sobre el dataset completo
+        cube = AggregationCube.from_frame(data_manager.scan_files(new_files))
+    cube.save(str(data_manager.artifact_path(new_key, 'cube.parquet')))
+    
+    # Tablas de regiones: se suma la del lote; sin tabla previa, la aplicación la calcula al usarla
+    for level in RegionAggregates.LEVELS:
+        name = f'region_aggregates_{level.lower()}.parquet'
+        old_regions = data_manager.artifact_path(old_key, name)
+        if old_regions.exists():
+            regions = RegionAggregates.load(str(old_regions)).merge(RegionAggregates.from_frame(df, level))
+            regions.save(str(data_manager.artifact_path(new_key, name)))
+    
+    # Celdas del mapa: se suman las del lote; sin celdas previas, la aplicación las calcula al usarlas
+    old_cells = data_manager.artifact_path(old_key, 'spatial_cells.parquet')
+    if old_cells.exists():
+        cells = spatial.merge_cells(pd.read_parquet(old_cells), spatial.grid_cells(df))
+        data_manager._save_frame(cells, data_manager.artifact_path(new_key, 'spatial_cells.parquet'))
+    
+    # Sin resumen previo, la aplicación lo calcula en la siguiente carga
+    old_summary = data_manager.artifact_path(old_key, 'summary.json')
+    if old_summary.exists():
+        states = summary.merge_states(json.loads(old_summary.read_text()), summary.compute_states(df))
+        data_manager._save_json(states, data_manager.artifact_path(new_key, 'summary.json'))
+
+
+# Incorporar un CSV al dataset
+def ingest_batch(data_manager: DataManager, csv_file: str) -> dict:
+    base_csv = data_manager.fetch_dataset()
+    old_files = data_manager.dataset_files(base_csv)
+
+    df = read_batch(data_manager, csv_file)
+    rows_read = len(df)
+    df, rejected, duplicated_in_batch = validate_batch(df)
+    df = data_manager._apply_compact_dtypes(df)
+    df, already_ingested = drop_existing_ids(data_manager, old_files, df)
+
+    partitions = []
+    if not df.empty:
+        # Nombre del lote según su contenido: reingestar el mismo archivo no crea particiones nuevas
+        batch_hash = data_manager._file_hash(csv_file)[:16]
+        batch_name = f"batch_{batch_hash}"
+        # Semilla derivada del contenido: con una semilla común, todos los lotes repetirían la misma
+        # secuencia de claves y las muestras quedarían correlacionadas con la posición en el lote
+        # Claves uniformes: dentro de cada estrato, una fracción de clave entra con la misma
+        # probabilidad para las filas del lote que para las del dataset base
+        df['Sample_Key'] = data_manager._sample_keys(df, seed=int(batch_hash, 16), uniform=True)
+        partitions = data_manager.write_partitions(df, data_manager.ingest_dir(), batch_name)
+        fold_aggregates(data_manager, old_files, data_manager.dataset_files(base_csv), df)
+
+    return {
+        'archivo': csv_file,
+        'leidos': rows_read,
+        'invalidos': rejected,
+        'duplicados': duplicated_in_batch + already_ingested,
+        'incorporados': len(df),
+        'particiones': partitions,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incorporar lotes nuevos de accidentes (CSV) al dataset")
+    parser.add_argument('csv_files', nargs='+', help="Archivos CSV con el formato de US-Accidents")
+    args = parser.parse_args()
+
+    data_manager = DataManager()
+    for csv_file in args.csv_files:
+        summary = ingest_batch(data_manager, csv_file)
+        print(f"{summary['archivo']}: {summary['incorporados']:,} registros incorporados "
+              f"({summary['leidos']:,} leídos, {summary['invalidos']:,} inválidos, "
+              f"{summary['duplicados']:,} duplicados) en {len(summary['particiones'])} particiones")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+Carga del dataset en segundo plano
+La descarga, la conversión del CSV por bloques y la muestra compartida corren en un hilo que se
+inicia al mostrar la página inicial. Las sesiones consultan el progreso (etapa, bloques leídos y un
+resumen parcial de las filas ya interpretadas) sin bloquearse; Pandas y Polars se importan en el hilo
+"""
+
+import logging
+import os
+import threading
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# PREFETCH_DATASET=0 desactiva la carga en segundo plano (la aplicación carga al pulsar el botón)
+ENABLED = os.environ.get('PREFETCH_DATASET', '1') != '0'
+# Filas del primer bloque que se muestran mientras se carga el resto
+PREVIEW_ROWS = 100
+
+
+class LoadProgress:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stage = "En cola"
+        self.fraction = 0.0
+        self.chunks = 0
+        self.rows = 0
+        # Estados parciales de summary de los bloques leídos (se combinan con merge_states)
+        self.states = None
+        self.preview = None
+        self.error = None
+        self.done = False
+
+    def set_stage(self, stage: str, fraction: Optional[float] = None):
+        with self._lock:
+            self.stage = stage
+            if fraction is not None:
+                self.fraction = fraction
+
+    # Registrar un bloque interpretado: su resumen se suma al de los anteriores
+    def add_chunk(self, chunk, fraction: float):
+        import summary
+
+        states = summary.compute_states(chunk.lazy())
+        with self._lock:
+            self.states = states if self.states is None else summary.merge_states(self.states, states)
+            self.chunks += 1
+            self.rows += chunk.height
+            self.fraction = fraction
+            if self.preview is None:
+                self.preview = chunk.head(PREVIEW_ROWS).to_pandas()
+
+    def finish(self, error: Optional[str] = None):
+        with self._lock:
+            self.error = error
+            self.done = True
+            if error is None:
+                self.stage, self.fraction = "Listo", 1.0
+
+    # Copia consistente del progreso para dibujarlo ('states' son los estados parciales del resumen)
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'stage': self.stage,
+                'fraction': self.fraction,
+                'chunks': self.chunks,
+                'rows': self.rows,
+                'states': self.states,
+                'preview': self.preview,
+                'error': self.error,
+                'done': self.done,
+            }
+
+
+_progress = None
+_lock = threading.Lock()
+
+
+# Iniciar la carga (una vez por proceso; se reintenta si la anterior falló)
+# Retorna su progreso, o None si la carga en segundo plano está desactivada
+def start() -> Optional[LoadProgress]:
+    global _progress
+    if not ENABLED:
+        return None
+    with _lock:
+        if _progress is None or _progress.error is not None:
+            _progress = LoadProgress()
+            threading.Thread(target=_run, args=(_progress,), name='carga-dataset', daemon=True).start()
+        return _progress
+
+
+def _run(progress: LoadProgress):
+    try:
+        from data_manager import get_data_manager
+
+        # La instancia compartida: su caché y sus hilos son los que usan después las sesiones
+        data_manager = get_data_manager()
+        progress.set_stage("Descargando dataset")
+        csv_file = data_manager.fetch_dataset()
+        progress.set_stage("Convirtiendo CSV por bloques")
+        data_manager.build_columnar_cache(csv_file, on_chunk=progress.add_chunk)
+        # La muestra mayor queda mapeada en la caché del proceso: los modos de muestra solo la recortan
+        progress.set_stage("Preparando la muestra compartida", 1.0)
+        files = data_manager.dataset_files(csv_file)
+        data_manager.load_sample(files, max(data_manager.SAMPLE_TIERS))
+        progress.finish()
+    except Exception as e:
+        logger.exception("Error cargando el dataset en segundo plano")
+        progress.finish(error=str(e))
@@ -0,0 +1,72 @@
+"""
+Precálculo de todos los artefactos derivados antes del despliegue
+Construye la copia columnar particionada, la muestra compartida en Arrow y, para cada muestra
+y para el dataset completo, el cubo de conteos, las celdas del mapa agregado, las tablas de
+regiones (estado y ciudad) y el resumen general. Todo queda en la caché versionada por dataset,
+de donde la aplicación solo lo lee
+
+Uso:
+    python precompute.py [--workers N]
+"""
+
+import argparse
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from data_manager import DataManager
+
+# Artefacto -> método de DataManager que lo calcula (o lo lee si ya existe)
+ARTIFACTS = {
+    'cubo': 'build_aggregation_cube',
+    'celdas del mapa': 'build_spatial_bins',
+    'regiones por estado': 'build_region_aggregates',
+    # Construye la tabla por ciudad al consultarla
+    'regiones por ciudad': 'get_city_summary',
+    'resumen general': 'get_data_summary',
+}
+
+
+# Construir un artefacto para una muestra (None = dataset completo) en un proceso del pool
+# Cada proceso mapea la misma copia Arrow de la muestra, sin copiarla
+def build_artifact(task: tuple) -> float:
+    sample_size, artifact = task
+    data_manager = DataManager()
+    files = data_manager.dataset_files(data_manager.fetch_dataset())
+    df = data_manager.scan_dataset(files) if sample_size is None else data_manager.load_sample(files, sample_size)
+    start = time.perf_counter()
+    getattr(data_manager, ARTIFACTS[artifact])(df)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precalcular los artefactos de la aplicación")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Procesos en paralelo")
+    args = parser.parse_args()
+
+    # Pasos compartidos por todos los artefactos: descarga, copia columnar y muestra en Arrow
+    start = time.perf_counter()
+    data_manager = DataManager()
+    try:
+        csv_file = data_manager.fetch_dataset()
+    except Exception as e:
+        raise SystemExit(f"No se pudo descargar el dataset: {e}")
+    files = data_manager.dataset_files(csv_file)
+    data_manager.build_shared_prefix(files, max(DataManager.SAMPLE_TIERS))
+    print(f"Dataset {data_manager.dataset_version(files)}: copia columnar y muestras "
+          f"en {time.perf_counter() - start:.1f} s")
+
+    tasks = [(sample_size, artifact)
+             for sample_size in DataManager.SAMPLE_TIERS + (None,)
+             for artifact in ARTIFACTS]
+    # 'spawn': Polars usa hilos propios y un proceso creado con fork puede quedar bloqueado
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=context) as pool:
+        for (sample_size, artifact), seconds in zip(tasks, pool.map(build_artifact, tasks)):
+            muestra = 'completo' if sample_size is None else f"{sample_size:,} registros"
+            print(f"  {artifact} ({muestra}): {seconds:.1f} s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,219 @@
+"""
+Instrumentación de cada rerun: latencia, filas procesadas, aciertos de caché y memoria por etapa
+Las etapas se marcan con el decorador profiled o el context manager stage; app.py agrupa las de
+un rerun con rerun(). Cada rerun se escribe en el log como una línea JSON y los totales del
+proceso se exportan en el formato de texto de Prometheus
+"""
+
+import functools
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Optional
+
+from cache_manager import get_cache_manager
+
+logger = logging.getLogger(__name__)
+
+# Límites (segundos) de los buckets de los histogramas de latencia
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Reruns recientes que se conservan para los percentiles
+HISTORY_SIZE = 500
+# Archivo opcional donde escribir las métricas tras cada rerun (p. ej. textfile collector de node_exporter)
+METRICS_FILE = os.environ.get('PROFILING_METRICS_FILE')
+METRIC_PREFIX = 'accidents_app'
+
+
+class Histogram:
+    def __init__(self):
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    # Registrar una observación (buckets acumulados, como los espera Prometheus)
+    def observe(self, seconds: float):
+        self.count += 1
+        self.sum += seconds
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+
+
+# Estado del proceso, compartido por todas las sesiones
+_lock = threading.Lock()
+_stage_histograms = {}
+_stage_rows = {}
+_rerun_histogram = Histogram()
+_history = deque(maxlen=HISTORY_SIZE)
+
+# Estado de la sesión: Streamlit ejecuta cada rerun en el hilo de su sesión
+_local = threading.local()
+
+
+# Memoria residente del proceso en bytes (0 si el sistema no expone /proc)
+def current_rss_bytes() -> int:
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+
+# Filas de un DataFrame en memoria; None para consultas diferidas (contarlas las ejecutaría)
+def _rows_of(value) -> Optional[int]:
+    shape = getattr(value, 'shape', None)
+    if isinstance(shape, tuple) and shape:
+        return int(shape[0])
+    return None
+
+
+# Medir una etapa; `info['rows']` se puede completar dentro del bloque
+# Los aciertos de caché son los de todo el proceso durante la etapa (otras sesiones pueden sumar)
+@contextmanager
+def stage(name: str, rows: Optional[int] = None):
+    cache = get_cache_manager()
+    cache_before = cache.stats()
+    memory_before = current_rss_bytes()
+    depth = getattr(_local, 'depth', 0)
+    _local.depth = depth + 1
+    # El registro se agrega al empezar para que las etapas anidadas queden debajo de la que las llama
+    record = {'stage': name, 'depth': depth}
+    records = getattr(_local, 'records', None)
+    if records is not None:
+        records.append(record)
+    info = {'rows': rows}
+    start = time.perf_counter()
+    try:
+        yield info
+    finally:
+        seconds = time.perf_counter() - start
+        _local.depth = depth
+        cache_after = cache.stats()
+        record.update({
+            'seconds': round(seconds, 4),
+            'rows': info['rows'],
+            'cache_hits': cache_after['hits'] - cache_before['hits'],
+            'cache_misses': cache_after['misses'] - cache_before['misses'],
+            'memory_delta_mb': round((current_rss_bytes() - memory_before) / 1024 ** 2, 1),
+        })
+        with _lock:
+            _stage_histograms.setdefault(name, Histogram()).observe(seconds)
+            if info['rows'] is not None:
+                _stage_rows[name] = _stage_rows.get(name, 0) + info['rows']
+
+
+# Decorador que mide cada llamada como una etapa (por defecto, con el nombre calificado de la función)
+# Las filas son las del primer DataFrame recibido o, si no hay ni una consulta diferida, las del resultado
+def profiled(name: Optional[str] = None):
+    def decorator(func):
+        stage_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            import query_engine as qe
+            
+            with stage(stage_name) as info:
+                result = func(*args, **kwargs)
+                values = args + tuple(kwargs.values())
+                rows = next((r for r in map(_rows_of, values) if r is not None), None)
+                # Sobre una consulta diferida el resultado es un agregado, no las filas procesadas
+                if rows is None and not any(qe.is_lazy(value) for value in values):
+                    rows = _rows_of(result)
+                info['rows'] = rows
+                return result
+        return wrapper
+    return decorator
+
+
+# Agrupar las etapas de un rerun; al terminar se registra en el log y en los totales del proceso
+@contextmanager
+def rerun():
+    _local.records = []
+    _local.depth = 0
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        records, _local.records = _local.records, None
+        with _lock:
+            _rerun_histogram.observe(seconds)
+            _history.append(seconds)
+        logger.info(json.dumps({'event': 'rerun', 'seconds': round(seconds, 4), 'stages': records}))
+        if METRICS_FILE:
+            write_metrics_file(METRICS_FILE)
+
+
+# Etapas terminadas hasta ahora en el rerun en curso
+def current_stages() -> list:
+    return [record for record in getattr(_local, 'records', None) or [] if 'seconds' in record]
+
+
+# Percentil de la duración de los reruns recientes (None si aún no hay)
+def rerun_percentile(q: float) -> Optional[float]:
+    with _lock:
+        durations = sorted(_history)
+    if not durations:
+        return None
+    return durations[max(math.ceil(q / 100 * len(durations)) - 1, 0)]
+
+
+def _histogram_lines(metric: str, histogram: Histogram, labels: str = '') -> list:
+    separator = ',' if labels else ''
+    lines = [f'{metric}_bucket{{{labels}{separator}le="{bound}"}} {count}'
+             for bound, count in zip(LATENCY_BUCKETS, histogram.buckets)]
+    lines.append(f'{metric}_bucket{{{labels}{separator}le="+Inf"}} {histogram.count}')
+    suffix = f'{{{labels}}}' if labels else ''
+    lines.append(f'{metric}_sum{suffix} {histogram.sum:.6f}')
+    lines.append(f'{metric}_count{suffix} {histogram.count}')
+    return lines
+
+
+# Métricas del proceso en el formato de texto de Prometheus
+def prometheus_text() -> str:
+    cache_stats = get_cache_manager().stats()
+    with _lock:
+        stages = sorted(_stage_histograms.items())
+        stage_rows = sorted(_stage_rows.items())
+        lines = [
+            f'# HELP {METRIC_PREFIX}_rerun_seconds Duración de cada rerun de la aplicación',
+            f'# TYPE {METRIC_PREFIX}_rerun_seconds histogram',
+            *_histogram_lines(f'{METRIC_PREFIX}_rerun_seconds', _rerun_histogram),
+            f'# HELP {METRIC_PREFIX}_stage_seconds Duración de cada etapa instrumentada',
+            f'# TYPE {METRIC_PREFIX}_stage_seconds histogram',
+        ]
+        for name, histogram in stages:
+            lines.extend(_histogram_lines(f'{METRIC_PREFIX}_stage_seconds', histogram, f'stage="{name}"'))
+    lines += [
+        f'# HELP {METRIC_PREFIX}_stage_rows_total Filas procesadas por etapa',
+        f'# TYPE {METRIC_PREFIX}_stage_rows_total counter',
+        *(f'{METRIC_PREFIX}_stage_rows_total{{stage="{name}"}} {rows}' for name, rows in stage_rows),
+    ]
+    for key, kind, description in [('hits', 'counter', 'Aciertos de la caché'),
+                                   ('misses', 'counter', 'Fallos de la caché'),
+                                   ('evictions', 'counter', 'Expulsiones de la caché'),
+                                   ('bytes', 'gauge', 'Memoria ocupada por la caché')]:
+        metric = f'{METRIC_PREFIX}_cache_{key}' + ('_total' if kind == 'counter' else '')
+        lines += [f'# HELP {metric} {description}', f'# TYPE {metric} {kind}', f'{metric} {cache_stats[key]}']
+    lines += [
+        f'# HELP {METRIC_PREFIX}_resident_memory_bytes Memoria residente del proceso',
+        f'# TYPE {METRIC_PREFIX}_resident_memory_bytes gauge',
+        f'{METRIC_PREFIX}_resident_memory_bytes {current_rss_bytes()}',
+    ]
+    return '\n'.join(lines) + '\n'
+
+
+# Escribir las métricas de forma atómica (el colector nunca lee un archivo a medias)
+def write_metrics_file(path: str):
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(prometheus_text())
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning("No se pudieron escribir las métricas en %s: %s", path, e)
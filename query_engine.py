@@ -0,0 +1,63 @@
+"""
+Motor de consultas para los tabs de visualización
+Resuelve filtros y agregaciones tanto sobre DataFrames de Pandas (muestras en memoria)
+como sobre LazyFrames de Polars (dataset completo), recolectando solo resultados pequeños
+"""
+
+from typing import List, Optional
+
+import pandas as pd
+import polars as pl
+
+
+# Indica si los datos se manejan como consulta diferida de Polars
+def is_lazy(df) -> bool:
+    return isinstance(df, pl.LazyFrame)
+
+
+# Cantidad de registros
+def count_rows(df) -> int:
+    if is_lazy(df):
+        return df.select(pl.len()).collect().item()
+    return len(df)
+
+
+# Columnas disponibles
+def column_names(df) -> List[str]:
+    if is_lazy(df):
+        return df.collect_schema().names()
+    return df.columns.tolist()
+
+
+# Conteo por valor de una consulta diferida, equivalente a Series.value_counts()
+# (las muestras en memoria cuentan con FilterIndex y los gráficos con AggregationCube)
+# sort_index: ordenar por valor en lugar de por frecuencia
+# top: limitar a los N valores más frecuentes
+def value_counts(lf: pl.LazyFrame, column: str, sort_index: bool = False, top: Optional[int] = None) -> pd.Series:
+    query = lf.group_by(column).agg(pl.len().alias('count')).drop_nulls(column)
+    if sort_index:
+        query = query.sort(column)
+    else:
+        query = query.sort(['count', column], descending=[True, False])
+    if top is not None:
+        query = query.head(top)
+    counts = query.collect()
+    return pd.Series(
+        counts['count'].to_numpy(),
+        index=pd.Index(counts[column].to_list(), name=column),
+        name='count',
+    )
+
+
+# Muestra aleatoria de registros para visualizar puntos en el mapa
+def sample_rows(df, n: int, columns: Optional[List[str]] = None, seed: int = 42) -> pd.DataFrame:
+    if is_lazy(df):
+        query = df.select(columns) if columns else df
+        total = count_rows(query)
+        if total > n:
+            # Seleccionar n posiciones al azar sin materializar el resto del dataset
+            query = query.filter(pl.int_range(pl.len()).shuffle(seed=seed) < n)
+        return query.collect().to_pandas()
+
+    sample = df.sample(n=min(n, len(df)), random_state=seed)
+    return sample[columns] if columns else sample
@@ -0,0 +1,127 @@
+"""
+Agregados por región (estado o ciudad) para el mapa de estados
+Guarda, por región y por combinación de año, severidad y clima, la cantidad de registros y pares
+(suma, cantidad) de cada medida: los promedios siguen siendo exactos bajo cualquier filtro y se
+responden sumando filas de la tabla, sin recorrer los registros
+"""
+
+import os
+from pathlib import Path
+from typing import List
+
+import pandas as pd
+import polars as pl
+
+import query_engine as qe
+
+
+class RegionAggregates:
+    # Columnas que identifican la región en cada nivel
+    LEVELS = {
+        'State': ['State'],
+        'City': ['State', 'City'],
+    }
+    # Dimensiones por las que se puede filtrar (nombre del filtro de DataManager.filter_data -> columna)
+    # State es parte de la región en todos los niveles
+    FILTERS = {
+        'states': 'State',
+        'years': 'Year',
+        'severity': 'Severity',
+        'weather': 'Weather_Condition',
+    }
+    # Medidas con promedio: se guardan su suma (sum_<medida>) y sus valores no nulos (n_<medida>)
+    MEASURES = ['Severity', 'Start_Lat', 'Start_Lng', 'Temperature(F)']
+    # El nivel de ciudad no se divide por clima para mantener la tabla pequeña
+    LEVEL_FILTERS = {
+        'State': ['years', 'severity', 'weather'],
+        'City': ['years', 'severity'],
+    }
+
+    def __init__(self, table: pd.DataFrame, level: str):
+        self.table = table
+        self.level = level
+
+    @property
+    def keys(self) -> List[str]:
+        return self.LEVELS[self.level]
+
+    @property
+    def dimensions(self) -> List[str]:
+        columns = self.keys + [self.FILTERS[name] for name in self.LEVEL_FILTERS[self.level]]
+        return [column for column in columns if column in self.table.columns]
+
+    @property
+    def measures(self) -> List[str]:
+        return [m for m in self.MEASURES if f"sum_{m}" in self.table.columns]
+
+    # Construir la tabla desde un DataFrame de Pandas o un LazyFrame de Polars (una sola agrupación)
+    @classmethod
+    def from_frame(cls, df, level: str = 'State') -> 'RegionAggregates':
+        columns = qe.column_names(df)
+        dimensions = [c for c in cls.LEVELS[level] + [cls.FILTERS[name] for name in cls.LEVEL_FILTERS[level]]
+                      if c in columns]
+        measures = [m for m in cls.MEASURES if m in columns]
+        if qe.is_lazy(df):
+            lf = df
+        else:
+            lf = pl.from_pandas(df[list(dict.fromkeys(dimensions + measures))]).lazy()
+
+        exprs = [pl.len().alias('count')]
+        for m in measures:
+            values = pl.col(m).cast(pl.Float64).fill_nan(None)
+            exprs += [values.sum().alias(f"sum_{m}"), values.count().alias(f"n_{m}")]
+        table = (lf.filter(pl.col('State').is_not_null())
+                 .group_by(dimensions).agg(exprs)
+                 .collect().to_pandas())
+        return cls(cls._compact(table, dimensions), level)
+
+    # Las columnas de texto de la tabla se guardan como categorías en orden alfabético
+    @staticmethod
+    def _compact(table: pd.DataFrame, dimensions: List[str]) -> pd.DataFrame:
+        for column in dimensions:
+            if pd.api.types.is_numeric_dtype(table[column]):
+                continue
+            values = table[column].astype(object)
+            table[column] = values.astype(pd.CategoricalDtype(sorted(values.dropna().unique())))
+        return table
+
+    # Cantidad y promedios por región bajo los filtros (columnas: count y una por medida)
+    def query(self, **filters) -> pd.DataFrame:
+        table = self.table
+        for name in ['states'] + self.LEVEL_FILTERS[self.level]:
+            column = self.FILTERS[name]
+            if filters.get(name) and column in table.columns:
+                table = table[table[column].isin(list(filters[name]))]
+
+        totals = table.groupby(self.keys, observed=True)[
+            ['count'] + [f"{prefix}_{m}" for m in self.measures for prefix in ('sum', 'n')]
+        ].sum()
+        result = totals[['count']].copy()
+        for m in self.measures:
+            result[m] = (totals[f"sum_{m}"] / totals[f"n_{m}"].where(totals[f"n_{m}"] > 0)).round(2)
+        return result[result['count'] > 0].sort_index()
+
+    # Sumar la tabla de otro conjunto de filas (por ejemplo, un lote nuevo)
+    def merge(self, other: 'RegionAggregates') -> 'RegionAggregates':
+        if other.level != self.level:
+            raise ValueError("Las tablas son de niveles distintos")
+        dimensions = self.dimensions
+        table = pd.concat([self.table, other.table], ignore_index=True)
+        for column in dimensions:
+            # Categorías distintas en cada tabla: agrupar por el valor
+            if not pd.api.types.is_numeric_dtype(table[column]):
+                table[column] = table[column].astype(object)
+        table = table.groupby(dimensions, dropna=False, as_index=False).sum()
+        return RegionAggregates(self._compact(table, dimensions), self.level)
+
+    # Guardar la tabla en Parquet (escritura atómica)
+    def save(self, path: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        self.table.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'RegionAggregates':
+        table = pd.read_parquet(path)
+        return cls(table, 'City' if 'City' in table.columns else 'State')
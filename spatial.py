@@ -0,0 +1,185 @@
+"""
+Agregación espacial e índice de puntos para los mapas
+Los puntos se agrupan en el servidor a varias resoluciones (conteo y severidad promedio por celda),
+de modo que el mapa recibe unos miles de celdas en lugar de cientos de miles de puntos,
+y un índice por cuadrícula permite enviar solo los puntos de la vista actual
+"""
+
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+import polars as pl
+
+import query_engine as qe
+
+# Resoluciones disponibles (tamaño de celda en grados); todas son múltiplos de la más fina
+GRID_RESOLUTIONS = {
+    "Muy baja (1°)": 1.0,
+    "Baja (0.5°)": 0.5,
+    "Media (0.25°)": 0.25,
+    "Alta (0.1°)": 0.1,
+    "Muy alta (0.05°)": 0.05,
+}
+
+# Metros aproximados por grado de latitud
+METERS_PER_DEGREE = 111_000
+
+
+# Conteo y suma de severidad por celda a la resolución más fina
+def _finest_cells(df, cell_size: float) -> pd.DataFrame:
+    if qe.is_lazy(df):
+        return (
+            df.drop_nulls(['Start_Lat', 'Start_Lng', 'Severity'])
+            .group_by(
+                (pl.col('Start_Lat').cast(pl.Float64) / cell_size).floor().cast(pl.Int32).alias('lat_idx'),
+                (pl.col('Start_Lng').cast(pl.Float64) / cell_size).floor().cast(pl.Int32).alias('lng_idx'),
+            )
+            .agg(
+                pl.len().alias('count'),
+                pl.col('Severity').cast(pl.Float64).sum().alias('severity_sum'),
+            )
+            .collect()
+            .to_pandas()
+        )
+
+    points = df[['Start_Lat', 'Start_Lng', 'Severity']].dropna()
+    lat_idx = np.floor(points['Start_Lat'].to_numpy(dtype='float64') / cell_size).astype(np.int64)
+    lng_idx = np.floor(points['Start_Lng'].to_numpy(dtype='float64') / cell_size).astype(np.int64)
+    return _group_cells(lat_idx, lng_idx, np.ones(len(points), dtype=np.int64),
+                        points['Severity'].to_numpy(dtype='float64'))
+
+
+# Sumar conteos y severidad de las celdas con el mismo índice
+def _group_cells(lat_idx: np.ndarray, lng_idx: np.ndarray, counts: np.ndarray,
+                 severity_sum: np.ndarray) -> pd.DataFrame:
+    keys = np.stack([lat_idx, lng_idx], axis=1)
+    unique_keys, inverse = np.unique(keys, axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    return pd.DataFrame({
+        'lat_idx': unique_keys[:, 0],
+        'lng_idx': unique_keys[:, 1],
+        'count': np.bincount(inverse, weights=counts, minlength=len(unique_keys)).astype(np.int64),
+        'severity_sum': np.bincount(inverse, weights=severity_sum, minlength=len(unique_keys)),
+    })
+
+
+# Celdas en formato de visualización: centro, cantidad y severidad promedio
+def _to_layer_frame(cells: pd.DataFrame, cell_size: float) -> pd.DataFrame:
+    return pd.DataFrame({
+        'Lat': (cells['lat_idx'].to_numpy() + 0.5) * cell_size,
+        'Lng': (cells['lng_idx'].to_numpy() + 0.5) * cell_size,
+        'Accidentes': cells['count'].to_numpy(),
+        'Severidad_Promedio': np.round(cells['severity_sum'].to_numpy() / cells['count'].to_numpy(), 2),
+    })
+
+
+# Celdas de la resolución más fina (conteo y suma de severidad): las demás resoluciones se obtienen
+# combinándolas, y las de un lote nuevo se suman a las del dataset con merge_cells
+def grid_cells(df) -> pd.DataFrame:
+    return _finest_cells(df, min(GRID_RESOLUTIONS.values()))
+
+
+# Sumar dos conjuntos de celdas de la misma resolución
+def merge_cells(cells: pd.DataFrame, other: pd.DataFrame) -> pd.DataFrame:
+    both = pd.concat([cells, other], ignore_index=True)
+    return _group_cells(both['lat_idx'].to_numpy(dtype=np.int64), both['lng_idx'].to_numpy(dtype=np.int64),
+                        both['count'].to_numpy(), both['severity_sum'].to_numpy(dtype='float64'))
+
+
+# Capas de todas las resoluciones a partir de las celdas de la más fina (resolutions[0])
+def pyramid_from_cells(cells: pd.DataFrame, resolutions: Optional[List[float]] = None) -> Dict[float, pd.DataFrame]:
+    resolutions = sorted(resolutions or GRID_RESOLUTIONS.values())
+    finest = resolutions[0]
+
+    pyramid = {}
+    for cell_size in resolutions:
+        ratio = int(round(cell_size / finest))
+        if ratio == 1:
+            level = cells
+        else:
+            level = _group_cells(
+                np.floor_divide(cells['lat_idx'].to_numpy(dtype=np.int64), ratio),
+                np.floor_divide(cells['lng_idx'].to_numpy(dtype=np.int64), ratio),
+                cells['count'].to_numpy(),
+                cells['severity_sum'].to_numpy(dtype='float64'),
+            )
+        pyramid[cell_size] = _to_layer_frame(level, cell_size)
+    return pyramid
+
+
+# Tamaño aproximado en píxeles del mapa de PyDeck dentro de la página
+VIEWPORT_SIZE_PX = (1200, 500)
+
+
+# Límites (lat_min, lat_max, lng_min, lng_max) visibles para un centro y nivel de zoom (Web Mercator)
+def viewport_bounds(latitude: float, longitude: float, zoom: float,
+                    size_px=VIEWPORT_SIZE_PX) -> tuple:
+    width_px, height_px = size_px
+    lng_span = width_px * 360 / (256 * 2 ** zoom)
+    lat_span = height_px * 360 / (256 * 2 ** zoom) * np.cos(np.radians(latitude))
+    return (latitude - lat_span / 2, latitude + lat_span / 2,
+            longitude - lng_span / 2, longitude + lng_span / 2)
+
+
+# Índice espacial de puntos ordenados por celda de una cuadrícula fija
+# Una consulta por rectángulo visita solo las celdas que lo intersectan y reduce el resultado
+# a un presupuesto de puntos con una prioridad aleatoria fija por punto (estable entre consultas)
+class SpatialIndex:
+    def __init__(self, latitude: pd.Series, longitude: pd.Series, cell_size: float = 0.25, seed: int = 42):
+        lat = latitude.to_numpy(dtype='float64', na_value=np.nan)
+        lng = longitude.to_numpy(dtype='float64', na_value=np.nan)
+        positions = np.flatnonzero(np.isfinite(lat) & np.isfinite(lng))
+        lat, lng = lat[positions], lng[positions]
+
+        self.cell_size = cell_size
+        self.n_points = len(positions)
+        lat_idx = np.floor(lat / cell_size).astype(np.int64)
+        lng_idx = np.floor(lng / cell_size).astype(np.int64)
+        self._lat0 = int(lat_idx.min()) if self.n_points else 0
+        self._lng0 = int(lng_idx.min()) if self.n_points else 0
+        self._n_lat = int(lat_idx.max()) - self._lat0 + 1 if self.n_points else 0
+        self._n_lng = int(lng_idx.max()) - self._lng0 + 1 if self.n_points else 0
+
+        cells = (lat_idx - self._lat0) * self._n_lng + (lng_idx - self._lng0)
+        order = np.argsort(cells, kind='stable')
+        self._cells = cells[order]
+        self._rows = positions[order]
+        self._lat = lat[order]
+        self._lng = lng[order]
+        self._priority = np.random.default_rng(seed).random(self.n_points)[order]
+
+    # Posiciones (en el DataFrame original) de los puntos dentro del rectángulo,
+    # a lo sumo `budget` puntos
+    # Retorna las posiciones y la cantidad total de puntos en el rectángulo
+    def query(self, lat_min: float, lat_max: float, lng_min: float, lng_max: float,
+              budget: Optional[int] = None) -> tuple:
+        if self.n_points == 0:
+            return np.empty(0, dtype=np.int64), 0
+
+        def cell_range(vmin, vmax, origin, size):
+            lo = int(np.floor(vmin / self.cell_size)) - origin
+            hi = int(np.floor(vmax / self.cell_size)) - origin
+            return max(lo, 0), min(hi, size - 1)
+
+        r0, r1 = cell_range(lat_min, lat_max, self._lat0, self._n_lat)
+        c0, c1 = cell_range(lng_min, lng_max, self._lng0, self._n_lng)
+        if r0 > r1 or c0 > c1:
+            return np.empty(0, dtype=np.int64), 0
+
+        # Cada fila de la cuadrícula es un tramo contiguo del arreglo ordenado
+        bands = np.arange(r0, r1 + 1) * self._n_lng
+        starts = np.searchsorted(self._cells, bands + c0, side='left')
+        ends = np.searchsorted(self._cells, bands + c1, side='right')
+        candidates = np.concatenate([np.arange(s, e) for s, e in zip(starts, ends)])
+
+        # Descartar los puntos de las celdas del borde que quedan fuera del rectángulo
+        inside = ((self._lat[candidates] >= lat_min) & (self._lat[candidates] <= lat_max) &
+                  (self._lng[candidates] >= lng_min) & (self._lng[candidates] <= lng_max))
+        candidates = candidates[inside]
+        total = len(candidates)
+
+        if budget is not None and total > budget:
+            keep = np.argpartition(self._priority[candidates], budget - 1)[:budget]
+            candidates = candidates[keep]
+        return np.sort(self._rows[candidates]), total
@@ -0,0 +1,183 @@
+"""
+Resumen del dataset en una sola pasada
+Cada métrica del registro aporta una expresión a un único select de Polars (una sola consulta en
+el modo completo) y define un estado parcial en tipos de JSON que se puede combinar: el resumen de
+filas nuevas se suma al anterior con merge_states, sin volver a recorrer el histórico
+"""
+
+import datetime
+from typing import Callable, Dict, Iterable, List, Optional
+
+import polars as pl
+
+import query_engine as qe
+
+
+class Metric:
+    # name: clave en el resumen; columns: columnas que necesita (si falta alguna, la métrica se omite)
+    # expr(): expresión de Polars que produce el estado parcial en una sola fila
+    # normalize(valor de Polars) -> estado; merge(estado, estado) -> estado; finalize(estado) -> valor
+    def __init__(self, name: str, columns: List[str], expr: Callable[[], pl.Expr],
+                 merge: Callable, finalize: Callable, normalize: Callable = lambda value: value):
+        self.name = name
+        self.columns = columns
+        self.expr = expr
+        self.merge = merge
+        self.finalize = finalize
+        self.normalize = normalize
+
+
+METRICS: Dict[str, Metric] = {}
+
+
+# Agregar una métrica al registro (las siguientes consultas la incluyen en la misma pasada)
+def register(metric: Metric) -> Metric:
+    METRICS[metric.name] = metric
+    return metric
+
+
+def _combine(function: Callable) -> Callable:
+    # Combinar dos valores ignorando los nulos (estados de frames vacíos)
+    def merge(a, b):
+        if a is None or b is None:
+            return b if a is None else a
+        return function(a, b)
+    return merge
+
+
+def _merge_counts(a: list, b: list) -> list:
+    counts = dict((value, count) for value, count in a)
+    for value, count in b:
+        counts[value] = counts.get(value, 0) + count
+    return [[value, count] for value, count in counts.items()]
+
+
+# Lista de structs {columna, count} de value_counts -> pares [valor, cantidad]
+def _count_pairs(column: str) -> Callable[[list], list]:
+    return lambda rows: [[row[column], row['count']] for row in rows or []]
+
+
+# ==================== Tipos de métricas ====================
+
+def row_count(name: str) -> Metric:
+    return Metric(name, [], lambda: pl.len().alias(name), lambda a, b: a + b, lambda state: state)
+
+
+# Mínimo o máximo de una fecha, guardado en microsegundos desde 1970
+def datetime_bound(name: str, column: str, maximum: bool = False) -> Metric:
+    def expr():
+        epoch = pl.col(column).dt.epoch('us')
+        return (epoch.max() if maximum else epoch.min()).alias(name)
+
+    def finalize(state):
+        return None if state is None else datetime.datetime(1970, 1, 1) + datetime.timedelta(microseconds=state)
+
+    return Metric(name, [column], expr, _combine(max if maximum else min), finalize)
+
+
+# Cantidad de valores distintos; el estado son los valores (combinar es unirlos)
+def distinct_count(name: str, column: str) -> Metric:
+    return Metric(name, [column],
+                  lambda: pl.col(column).drop_nulls().unique().implode().alias(name),
+                  lambda a, b: sorted(set(a) | set(b)), len, normalize=lambda values: sorted(values or []))
+
+
+# Promedio; el estado es [suma, cantidad] para que siga siendo exacto al combinar
+def mean(name: str, column: str, decimals: int = 2) -> Metric:
+    def expr():
+        values = pl.col(column).fill_nan(None)
+        return pl.struct(values.sum().alias('sum'), values.count().alias('count')).alias(name)
+
+    def finalize(state):
+        return round(state[0] / state[1], decimals) if state[1] else None
+
+    return Metric(name, [column], expr, lambda a, b: [a[0] + b[0], a[1] + b[1]], finalize,
+                  normalize=lambda value: [value['sum'] or 0.0, value['count']])
+
+
+# Conteo por valor (sin nulos), de mayor a menor; top limita las entradas del resultado
+def value_counts(name: str, column: str, top: Optional[int] = None) -> Metric:
+    def finalize(state):
+        ordered = sorted(state, key=lambda pair: pair[1], reverse=True)
+        return dict(ordered[:top] if top else ordered)
+
+    return Metric(name, [column], lambda: pl.col(column).drop_nulls().value_counts().implode().alias(name),
+                  _merge_counts, finalize, normalize=_count_pairs(column))
+
+
+# Percentiles sobre los valores redondeados a `resolution` (el conteo por valor se puede combinar)
+def percentiles(name: str, column: str, quantiles: Iterable[float] = (0.05, 0.25, 0.5, 0.75, 0.95),
+                resolution: float = 0.1) -> Metric:
+    quantiles = tuple(quantiles)
+
+    def expr():
+        steps = (pl.col(column).fill_nan(None) / resolution).round().cast(pl.Int64).alias('step')
+        return steps.drop_nulls().value_counts().implode().alias(name)
+
+    def finalize(state):
+        ordered = sorted(state)
+        total = sum(count for _, count in ordered)
+        result, cumulative, i = {}, 0, 0
+        for q in quantiles:
+            while i < len(ordered) and cumulative + ordered[i][1] < q * total:
+                cumulative += ordered[i][1]
+                i += 1
+            result[q] = round(ordered[min(i, len(ordered) - 1)][0] * resolution, 6) if ordered else None
+        return result
+
+    return Metric(name, [column], expr, _merge_counts, finalize, normalize=_count_pairs('step'))
+
+
+# Proporción de nulos por columna; el estado es {columna: [nulos, filas]}
+def null_rates(name: str, columns: List[str]) -> Metric:
+    def expr():
+        return pl.struct([pl.col(c).null_count().alias(c) for c in columns] + [pl.len().alias('__rows__')]).alias(name)
+
+    def normalize(value):
+        return {c: [value[c], value['__rows__']] for c in columns}
+
+    def merge(a, b):
+        return {c: [a[c][0] + b[c][0], a[c][1] + b[c][1]] for c in columns}
+
+    def finalize(state):
+        return {c: round(nulls / rows, 4) if rows else None for c, (nulls, rows) in state.items()}
+
+    return Metric(name, columns, expr, merge, finalize, normalize=normalize)
+
+
+# ==================== Métricas del resumen de la aplicación ====================
+
+register(row_count('total_accidents'))
+register(datetime_bound('start_min', 'Start_Time'))
+register(datetime_bound('start_max', 'Start_Time', maximum=True))
+register(distinct_count('states_count', 'State'))
+register(distinct_count('cities_count', 'City'))
+register(value_counts('severity_distribution', 'Severity'))
+register(value_counts('most_common_weather', 'Weather_Condition', top=5))
+register(mean('avg_temperature', 'Temperature(F)'))
+register(percentiles('temperature_percentiles', 'Temperature(F)'))
+register(null_rates('null_rates', ['Start_Time', 'City', 'Weather_Condition', 'Temperature(F)', 'Visibility(mi)']))
+
+
+# Estados parciales de todas las métricas aplicables, en un solo select
+# Sobre Pandas se convierten a Polars solo las columnas que usan las métricas
+def compute_states(df, metrics: Optional[Iterable[Metric]] = None) -> dict:
+    columns = qe.column_names(df)
+    metrics = [m for m in (metrics or METRICS.values()) if all(c in columns for c in m.columns)]
+    if qe.is_lazy(df):
+        lf = df
+    else:
+        used = [c for c in columns if any(c in m.columns for m in metrics)]
+        lf = pl.from_pandas(df[used]).lazy()
+    row = lf.select([m.expr() for m in metrics]).collect().row(0, named=True)
+    return {m.name: m.normalize(row[m.name]) for m in metrics}
+
+
+# Combinar los estados de dos conjuntos de filas disjuntos (p. ej. el dataset y un lote nuevo)
+def merge_states(a: dict, b: dict) -> dict:
+    return {name: METRICS[name].merge(a[name], b[name]) for name in a if name in b and name in METRICS}
+
+
+# Valores finales del resumen (los estados no se modifican)
+def finalize(states: dict) -> dict:
+    return {name: METRICS[name].finalize(state) for name, state in states.items() if name in METRICS}
@@ -2,11 +2,13 @@
 Módulo de tabs para visualizaciones interactivas
 """
 
+from .filtros import show_filtros
 from .tabla_interactiva import show_tabla_interactiva
 from .graficos_estadisticos import show_graficos_estadisticos
 from .mapa_interactivo import show_mapa_interactivo
 
 __all__ = [
+    'show_filtros',
     'show_tabla_interactiva',
     'show_graficos_estadisticos',
     'show_mapa_interactivo'
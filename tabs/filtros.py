@@ -0,0 +1,60 @@
+# Filtros de análisis compartidos por todas las vistas
+
+
+import streamlit as st
+import pandas as pd
+from data_manager import get_data_manager
+from profiling import profiled
+
+
+# Cantidad de registros de un DataFrame (las consultas diferidas se cuentan una vez por filtro)
+def contar_registros(df) -> int:
+    return get_data_manager().count_rows(df)
+
+
+# Mostrar los filtros (se dibujan siempre, sobre la vista activa, para que no pierdan su valor)
+# df : DataFrame con los datos de accidentes
+# Retorna el DataFrame filtrado y los filtros aplicados (formato de DataManager.filter_data)
+@profiled()
+def show_filtros(df: pd.DataFrame):
+    data_manager = get_data_manager()
+
+    # Filtros en columnas (los valores disponibles salen del índice de filtros)
+    col1, col2, col3, col4 = st.columns(4)
+
+    with col1:
+        # Filtro por Estado
+        estados_disponibles = ['Todos'] + sorted(data_manager.get_filter_options(df, 'State').index.tolist())
+        estado_seleccionado = st.selectbox("🗺️ Estado", estados_disponibles, key="tabla_estado")
+
+    with col2:
+        # Filtro por Severidad
+        severidades = ['Todas'] + sorted(data_manager.get_filter_options(df, 'Severity').index.tolist())
+        severidad_seleccionada = st.selectbox("🚨 Severidad", severidades, key="tabla_severidad")
+
+    with col3:
+        # Filtro por Año
+        años = ['Todos'] + sorted(data_manager.get_filter_options(df, 'Year').index.tolist(), reverse=True)
+        año_seleccionado = st.selectbox("📅 Año", años, key="tabla_año")
+
+    with col4:
+        # Filtro por Condición Climática (Top 10)
+        top_weather = data_manager.get_filter_options(df, 'Weather_Condition').head(10).index.tolist()
+        climas = ['Todas'] + top_weather
+        clima_seleccionado = st.selectbox("🌤️ Condición Climática", climas, key="tabla_clima")
+
+    # Aplicar filtros (índice invertido en memoria o predicados de Polars si el dataset es diferido)
+    filtros = {
+        'states': [estado_seleccionado] if estado_seleccionado != 'Todos' else None,
+        'severity': [severidad_seleccionada] if severidad_seleccionada != 'Todas' else None,
+        'years': [año_seleccionado] if año_seleccionado != 'Todos' else None,
+        'weather': [clima_seleccionado] if clima_seleccionado != 'Todas' else None,
+    }
+    df_filtrado = data_manager.filter_data(df, **filtros)
+
+    # Mostrar estadísticas de filtrado
+    total_registros = contar_registros(df)
+    total_filtrados = contar_registros(df_filtrado)
+    st.info(f"📊 Mostrando {total_filtrados:,} registros de {total_registros:,} totales ({total_filtrados/total_registros*100:.1f}%)")
+
+    return df_filtrado, filtros
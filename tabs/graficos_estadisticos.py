@@ -2,110 +2,163 @@
 
 import streamlit as st
 import pandas as pd
-import plotly.express as px
+from typing import Optional
+import approximate
+from data_manager import DataManager, get_data_manager
+from profiling import profiled
+
+# Figuras de cada grupo de gráficos (sin Streamlit): dependen solo del cubo y de los filtros
+# Cada una retorna pares (título, figura) que se dibujan en dos columnas
+# Con un cubo aproximado, las barras de error son el intervalo de confianza del 95% de cada conteo
+# Plotly se importa al construir la primera figura, no al arrancar la aplicación
+
+def figuras_severidad(cube, filtros: dict) -> list:
+    import plotly.express as px
+    
+    # Gráfico de barras: Distribución por Severidad
+    severity_counts = cube.value_counts('Severity', sort_index=True, **filtros)
+    fig_severity = px.bar(
+        x=severity_counts.index,
+        y=severity_counts.values,
+        labels={'x': 'Nivel de Severidad', 'y': 'Cantidad de Accidentes'},
+        color=severity_counts.values,
+        color_continuous_scale='Reds',
+        text=severity_counts.values,
+        error_y=cube.margins(severity_counts)
+    )
+    fig_severity.update_traces(texttemplate='%{text:,}', textposition='outside')
+    fig_severity.update_layout(showlegend=False, height=400)
+    
+    # Gráfico de pie: Top 10 Estados
+    top_states = cube.value_counts('State', top=10, **filtros)
+    fig_states = px.pie(
+        values=top_states.values,
+        names=top_states.index,
+        hole=0.4
+    )
+    fig_states.update_traces(textposition='inside', textinfo='percent+label')
+    fig_states.update_layout(height=400)
+    
+    return [("#### 🚨 Distribución por Severidad", fig_severity),
+            ("#### 🗺️ Top 10 Estados con Más Accidentes", fig_states)]
+
+def figuras_temporales(cube, filtros: dict) -> list:
+    import plotly.express as px
+    
+    # Gráfico de líneas: Accidentes por Hora del Día
+    hourly = cube.value_counts('Hour', sort_index=True, **filtros)
+    fig_hourly = px.line(
+        x=hourly.index,
+        y=hourly.values,
+        labels={'x': 'Hora del Día', 'y': 'Cantidad de Accidentes'},
+        markers=True,
+        error_y=cube.margins(hourly)
+    )
+    fig_hourly.update_traces(line_color='#1f77b4', line_width=3)
+    fig_hourly.update_layout(height=400)
+    
+    # Gráfico de barras: Accidentes por Día de la Semana
+    # Day_of_Week es 0-6 (lunes a domingo): se ordena por su valor y se rotula con su nombre
+    day_counts = cube.value_counts('Day_of_Week', **filtros).reindex(range(len(DataManager.DAYS_OF_WEEK)))
+    fig_days = px.bar(
+        x=DataManager.DAYS_OF_WEEK,
+        y=day_counts.values,
+        labels={'x': 'Día de la Semana', 'y': 'Cantidad de Accidentes'},
+        color=day_counts.values,
+        color_continuous_scale='Blues',
+        error_y=cube.margins(day_counts)
+    )
+    fig_days.update_layout(showlegend=False, height=400)
+    
+    return [("#### ⏰ Accidentes por Hora del Día", fig_hourly),
+            ("#### 📅 Accidentes por Día de la Semana", fig_days)]
+
+def figuras_climaticas(cube, filtros: dict) -> list:
+    import plotly.express as px
+    
+    # Histograma: Distribución de Temperatura
+    # Bins fijos sobre el rango completo del dataset, precalculados en el cubo
+    temp_hist = cube.temperature_histogram(**filtros)
+    fig_temp = px.bar(
+        temp_hist,
+        x='Temperature(F)',
+        y='count',
+        labels={'Temperature(F)': 'Temperatura (°F)'},
+        color_discrete_sequence=['#ff7f0e'],
+        error_y=cube.margins(temp_hist['count'])
+    )
+    fig_temp.update_layout(showlegend=False, height=400, bargap=0)
+    
+    # Top 10 Condiciones Climáticas
+    top_weather = cube.value_counts('Weather_Condition', top=10, **filtros)
+    fig_weather = px.bar(
+        x=top_weather.values,
+        y=top_weather.index,
+        orientation='h',
+        labels={'x': 'Cantidad de Accidentes', 'y': 'Condición Climática'},
+        color=top_weather.values,
+        color_continuous_scale='Viridis',
+        error_x=cube.margins(top_weather)
+    )
+    fig_weather.update_layout(showlegend=False, height=400)
+    
+    return [("#### 🌡️ Distribución de Temperatura", fig_temp),
+            ("#### 🌤️ Top 10 Condiciones Climáticas", fig_weather)]
+
+GRUPOS = {
+    "Severidad": figuras_severidad,
+    "Temporal": figuras_temporales,
+    "Climático": figuras_climaticas,
+}
+
+# Dibujar las figuras de un grupo en los espacios de sus columnas (reemplaza las anteriores)
+def dibujar_figuras(espacios: list, figuras: list, etapa: str):
+    for i, (espacio, (titulo, figura)) in enumerate(zip(espacios, figuras)):
+        with espacio.container():
+            st.markdown(titulo)
+            st.plotly_chart(figura, use_container_width=True, key=f"grafico_{i}_{etapa}")
 
 # Mostrar gráficos estadísticos interactivos
-# df : DataFrame con los datos de accidentes
-def show_graficos_estadisticos(df: pd.DataFrame):
+# df : DataFrame con los datos de accidentes (sin filtrar)
+# filtros : filtros activos en el formato de DataManager.filter_data
+# aproximado : mostrar estimaciones sobre fracciones crecientes del dataset mientras el cubo
+#              exacto se calcula en segundo plano (df debe ser la consulta diferida del dataset completo)
+# pendientes : lista de la sesión con los cálculos exactos en curso (ver DataManager.background_result)
+# Los conteos salen del cubo de agregación, sin recorrer los registros
+@profiled()
+def show_graficos_estadisticos(df: pd.DataFrame, filtros: Optional[dict] = None, aproximado: bool = False,
+                               pendientes: Optional[list] = None):
     st.markdown("### 📈 Análisis Estadístico")
     
-    # Subtabs para diferentes tipos de gráficos
-    subtab1, subtab2, subtab3 = st.tabs(["Severidad", "Temporal", "Climático"])
+    data_manager = get_data_manager()
+    filtros = filtros or {}
+    
+    # Solo se calcula y dibuja el grupo elegido (st.tabs ejecutaría los tres)
+    grupo = st.radio("Gráficos", list(GRUPOS), horizontal=True, key="graficos_grupo", label_visibility="collapsed")
+    
+    # Las figuras se reutilizan mientras no cambien el dataset ni los filtros
+    clave = ('graficos', grupo, data_manager.filter_signature(filtros))
+    calcular = lambda: GRUPOS[grupo](data_manager.build_aggregation_cube(df), filtros)
+    aviso = st.empty()
+    espacios = [col.empty() for col in st.columns(2)]
     
-    # ==================== SUBTAB 1: SEVERIDAD ====================
-    with subtab1:
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            # Gráfico de barras: Distribución por Severidad
-            st.markdown("#### 🚨 Distribución por Severidad")
-            severity_counts = df['Severity'].value_counts().sort_index()
-            fig_severity = px.bar(
-                x=severity_counts.index,
-                y=severity_counts.values,
-                labels={'x': 'Nivel de Severidad', 'y': 'Cantidad de Accidentes'},
-                color=severity_counts.values,
-                color_continuous_scale='Reds',
-                text=severity_counts.values
-            )
-            fig_severity.update_traces(texttemplate='%{text:,}', textposition='outside')
-            fig_severity.update_layout(showlegend=False, height=400)
-            st.plotly_chart(fig_severity, use_container_width=True)
-        
-        with col2:
-            # Gráfico de pie: Top 10 Estados
-            st.markdown("#### 🗺️ Top 10 Estados con Más Accidentes")
-            top_states = df['State'].value_counts().head(10)
-            fig_states = px.pie(
-                values=top_states.values,
-                names=top_states.index,
-                hole=0.4
-            )
-            fig_states.update_traces(textposition='inside', textinfo='percent+label')
-            fig_states.update_layout(height=400)
-            st.plotly_chart(fig_states, use_container_width=True)
+    if not aproximado:
+        dibujar_figuras(espacios, data_manager.cached_result(clave, df, calcular), 'exacto')
+        return
     
-    # ==================== SUBTAB 2: TEMPORAL ====================
-    with subtab2:
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            # Gráfico de líneas: Accidentes por Hora del Día
-            st.markdown("#### ⏰ Accidentes por Hora del Día")
-            hourly = df['Hour'].value_counts().sort_index()
-            fig_hourly = px.line(
-                x=hourly.index,
-                y=hourly.values,
-                labels={'x': 'Hora del Día', 'y': 'Cantidad de Accidentes'},
-                markers=True
-            )
-            fig_hourly.update_traces(line_color='#1f77b4', line_width=3)
-            fig_hourly.update_layout(height=400)
-            st.plotly_chart(fig_hourly, use_container_width=True)
-        
-        with col2:
-            # Gráfico de barras: Accidentes por Día de la Semana
-            st.markdown("#### 📅 Accidentes por Día de la Semana")
-            dias_orden = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-            day_counts = df['Day_of_Week'].value_counts().reindex(dias_orden)
-            fig_days = px.bar(
-                x=day_counts.index,
-                y=day_counts.values,
-                labels={'x': 'Día de la Semana', 'y': 'Cantidad de Accidentes'},
-                color=day_counts.values,
-                color_continuous_scale='Blues'
-            )
-            fig_days.update_layout(showlegend=False, height=400)
-            st.plotly_chart(fig_days, use_container_width=True)
+    # Modo aproximado: estimaciones de menor a mayor fracción hasta que el cubo exacto esté listo
+    figuras = data_manager.background_result(clave, df, calcular, pendientes)
+    for fraccion in approximate.FRACTIONS:
+        if figuras is not None:
+            break
+        cube = data_manager.build_approximate_cube(df, fraccion)
+        dibujar_figuras(espacios, data_manager.cached_result(clave + (fraccion,), df,
+                                                             lambda: GRUPOS[grupo](cube, filtros)), f"{fraccion}")
+        aviso.caption(f"🎯 Estimación con el {fraccion:.0%} de los registros ({cube.sample_rows:,} filas); "
+                      f"las barras de error son el intervalo de confianza del 95%. "
+                      f"Los valores exactos se calculan en segundo plano.")
+        figuras = data_manager.background_result(clave, df, calcular, pendientes)
     
-    # ==================== SUBTAB 3: CLIMÁTICO ====================
-    with subtab3:
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            # Histograma: Distribución de Temperatura
-            st.markdown("#### 🌡️ Distribución de Temperatura")
-            fig_temp = px.histogram(
-                df,
-                x='Temperature(F)',
-                nbins=50,
-                labels={'Temperature(F)': 'Temperatura (°F)'},
-                color_discrete_sequence=['#ff7f0e']
-            )
-            fig_temp.update_layout(showlegend=False, height=400)
-            st.plotly_chart(fig_temp, use_container_width=True)
-        
-        with col2:
-            # Top 10 Condiciones Climáticas
-            st.markdown("#### 🌤️ Top 10 Condiciones Climáticas")
-            top_weather = df['Weather_Condition'].value_counts().head(10)
-            fig_weather = px.bar(
-                x=top_weather.values,
-                y=top_weather.index,
-                orientation='h',
-                labels={'x': 'Cantidad de Accidentes', 'y': 'Condición Climática'},
-                color=top_weather.values,
-                color_continuous_scale='Viridis'
-            )
-            fig_weather.update_layout(showlegend=False, height=400)
-            st.plotly_chart(fig_weather, use_container_width=True)
+    if figuras is not None:
+        aviso.empty()
+        dibujar_figuras(espacios, figuras, 'exacto')
@@ -2,28 +2,77 @@
 
 import streamlit as st
 import pandas as pd
-import pydeck as pdk
-import plotly.express as px
+from typing import Optional
+import query_engine as qe
+import spatial
+import colors
+from data_manager import get_data_manager
+from profiling import profiled
 
-# Mostrar mapas interactivos con PyDeck y Plotly
+# Mostrar mapas interactivos con PyDeck y Plotly (se importan al dibujar el mapa que los usa)
 # df: DataFrame con los datos de accidentes
-def show_mapa_interactivo(df: pd.DataFrame):
+# df_filtrado: DataFrame con los filtros aplicados (mapas de puntos y celdas)
+# filtros: filtros activos en el formato de DataManager.filter_data (mapa de estados)
+@profiled()
+def show_mapa_interactivo(df: pd.DataFrame, df_filtrado: pd.DataFrame, filtros: Optional[dict] = None):
     st.markdown("### 🗺️ Visualización Geoespacial")
     
-    # Crear subtabs para los diferentes mapas
-    tab_dispersion, tab_choropleth = st.tabs(["📍 Mapa de Dispersión", "🗺️ Mapa de Estados"])
+    # Solo se calcula y dibuja el mapa elegido (st.tabs ejecutaría los tres)
+    mapa = st.radio("Mapa", ["📍 Mapa de Dispersión", "⬢ Mapa Agregado", "🗺️ Mapa de Estados"],
+                    horizontal=True, key="mapa_vista", label_visibility="collapsed")
     
-    # Tab 1: Mapa de Dispersión
-    with tab_dispersion:  
-        show_mapa_dispersion(df)
-
-    # Tab 2: Mapa Choropleth de Estados
-    with tab_choropleth:
-        show_mapa_choropleth(df)
+    if mapa == "📍 Mapa de Dispersión":
+        show_mapa_dispersion(df, df_filtrado)
+    elif mapa == "⬢ Mapa Agregado":
+        show_mapa_agregado(df_filtrado)
+    else:
+        # El mapa de estados se responde con la tabla de regiones del dataset completo
+        show_mapa_choropleth(df, filtros or {})
         
 
+# Puntos del mapa de dispersión con su color RGBA (sin Streamlit, cacheable por parámetros)
+# limites: (lat_min, lat_max, lng_min, lng_max) del área visible, o None para una muestra de todo el dataset
+# Retorna los puntos y la cantidad de accidentes en la vista (None sin límites)
+def preparar_puntos(df: pd.DataFrame, max_points: int, color_by: str, limites: Optional[tuple] = None) -> tuple:
+    # Solo las columnas que usa la capa
+    columnas_mapa = [c for c in ['Start_Lat', 'Start_Lng', 'Severity', 'City', 'State', 'Temperature(F)', 'Visibility(mi)']
+                     if c in qe.column_names(df)]
+    
+    if limites is not None:
+        # Nivel de detalle: solo los puntos del área visible, hasta el máximo de puntos
+        df_mapa, total_vista = get_data_manager().get_viewport_points(df, limites, max_points, columnas_mapa)
+        df_mapa = df_mapa.copy()
+    else:
+        # Tomar muestra para el mapa
+        df_mapa, total_vista = qe.sample_rows(df, max_points, columnas_mapa).copy(), None
+    
+    # Limpiar valores NaN que pueden causar errores en el mapa
+    df_mapa = df_mapa.dropna(subset=['Start_Lat', 'Start_Lng', 'Severity'])
+    
+    # Rellenar valores NaN en otras columnas con valores por defecto
+    if 'Temperature(F)' in df_mapa.columns:
+        df_mapa['Temperature(F)'] = df_mapa['Temperature(F)'].fillna(df_mapa['Temperature(F)'].median())
+    if 'Visibility(mi)' in df_mapa.columns:
+        df_mapa['Visibility(mi)'] = df_mapa['Visibility(mi)'].fillna(df_mapa['Visibility(mi)'].median())
+    
+    # Configurar colores según la opción seleccionada (arreglo RGBA de N x 4 calculado de una vez)
+    if color_by == "Severidad":
+        rgba = colors.severity_colors(df_mapa['Severity'])
+    elif color_by == "Temperatura":
+        rgba = colors.temperature_colors(df_mapa['Temperature(F)'])
+    else:
+        rgba = colors.visibility_colors(df_mapa['Visibility(mi)'])
+    
+    # Un canal por columna numérica en lugar de una lista de Python por fila
+    df_mapa[colors.RGBA_COLUMNS] = rgba
+    return df_mapa, total_vista
+
 # Mostrar mapa de dispersión
-def show_mapa_dispersion(df: pd.DataFrame):
+# Los centros de los estados salen de la tabla de regiones de `dataset` (sin filtrar)
+@profiled()
+def show_mapa_dispersion(dataset: pd.DataFrame, df: pd.DataFrame):
+    import pydeck as pdk
+    
     # Controles del mapa
     col1, col2 = st.columns(2)
     
@@ -35,79 +84,43 @@ def show_mapa_dispersion(df: pd.DataFrame):
         # Colorear por severidad
         color_by = st.selectbox("🎨 Colorear por", ["Severidad", "Temperatura", "Visibilidad"])
     
-    # Tomar muestra para el mapa y limpiar valores nulos
-    df_mapa = df.sample(n=min(max_points, len(df)), random_state=42).copy()
+    # Vista inicial: todo Estados Unidos
+    latitud, longitud, zoom = 37.0902, -95.7129, 4
     
-    # Limpiar valores NaN que pueden causar errores en el mapa
-    df_mapa = df_mapa.dropna(subset=['Start_Lat', 'Start_Lng', 'Severity'])
+    # Nivel de detalle: solo los puntos del área visible, hasta el máximo de puntos
+    nivel_detalle = st.toggle(
+        "🔍 Nivel de detalle según la vista",
+        help="Envía al mapa únicamente los accidentes dentro del área visible; al acercarse se ven todos los de la zona"
+    )
     
-    # Rellenar valores NaN en otras columnas con valores por defecto
-    if 'Temperature(F)' in df_mapa.columns:
-        df_mapa['Temperature(F)'].fillna(df_mapa['Temperature(F)'].median(), inplace=True)
-    if 'Visibility(mi)' in df_mapa.columns:
-        df_mapa['Visibility(mi)'].fillna(df_mapa['Visibility(mi)'].median(), inplace=True)
+    limites = None
+    if nivel_detalle:
+        centros = get_data_manager().get_state_summary(dataset)
+        col3, col4 = st.columns(2)
+        with col3:
+            centro = st.selectbox("📌 Centrar en", ['Estados Unidos'] + centros.index.tolist())
+        if centro != 'Estados Unidos':
+            latitud, longitud = float(centros.loc[centro, 'Start_Lat']), float(centros.loc[centro, 'Start_Lng'])
+            zoom = 6
+        with col4:
+            zoom = st.slider("🔎 Zoom", 3, 12, zoom)
+        limites = spatial.viewport_bounds(latitud, longitud, zoom)
     
-    st.info(f"🗺️ Mostrando {len(df_mapa):,} puntos en el mapa")
+    # Los puntos se reutilizan mientras no cambien los datos, la vista, el máximo ni el color
+    df_mapa, total_vista = get_data_manager().cached_result(
+        ('mapa_puntos', max_points, color_by, limites), df,
+        lambda: preparar_puntos(df, max_points, color_by, limites)
+    )
+    if total_vista is not None:
+        st.caption(f"🔍 {total_vista:,} accidentes en la vista actual")
     
-    # Configurar colores según la opción seleccionada
-    if color_by == "Severidad":
-        # Mapa de colores por severidad
-        color_map = {
-            1: [0, 255, 0, 160],    # Verde
-            2: [255, 255, 0, 160],  # Amarillo
-            3: [255, 165, 0, 160],  # Naranja
-            4: [255, 0, 0, 160]     # Rojo
-        }
-        df_mapa['color'] = df_mapa['Severity'].apply(
-            lambda x: color_map.get(x, [128, 128, 128, 160])
-        )
-        
-    elif color_by == "Temperatura":
-        # Normalizar temperatura a colores
-        temp_col = df_mapa['Temperature(F)']
-        temp_min = temp_col.min()
-        temp_max = temp_col.max()
-        
-        if pd.notna(temp_min) and pd.notna(temp_max) and temp_max > temp_min:
-            # Normalizar entre 0 y 1
-            temp_norm = (temp_col - temp_min) / (temp_max - temp_min)
-            # Crear colores (azul=frío, rojo=calor)
-            df_mapa['color'] = temp_norm.apply(
-                lambda x: [int(255*x) if pd.notna(x) else 128, 
-                            100, 
-                            int(255*(1-x)) if pd.notna(x) else 128, 
-                            160]
-            )
-        else:
-            # Color por defecto si no hay rango válido
-            df_mapa['color'] = [[100, 100, 255, 160] for _ in range(len(df_mapa))]
-
-    # Visibilidad   
-    else:
-        vis_col = df_mapa['Visibility(mi)']
-        vis_max = vis_col.max()
-        
-        if pd.notna(vis_max) and vis_max > 0:
-            # Normalizar visibilidad entre 0 y 1
-            vis_norm = vis_col / vis_max
-            # Crear colores más claros: rojo (baja) → amarillo (media) → verde (alta)
-            df_mapa['color'] = vis_norm.apply(
-                lambda x: [
-                    int(255 * (1 - x)) if pd.notna(x) else 128,  # Rojo disminuye con más visibilidad
-                    int(255 * min(2*x, 2*(1-x))) if pd.notna(x) else 128,  # Amarillo en el medio
-                    int(255 * x) if pd.notna(x) else 128,  # Verde aumenta con más visibilidad
-                    200  # Más opaco para mejor visibilidad
-                ]
-            )
-        else:
-            # Color por defecto
-            df_mapa['color'] = [[100, 255, 100, 160] for _ in range(len(df_mapa))]
+    st.info(f"🗺️ Mostrando {len(df_mapa):,} puntos en el mapa")
     
     layer = pdk.Layer(
         "ScatterplotLayer",
         data=df_mapa,
         get_position=["Start_Lng", "Start_Lat"],
-        get_color="color",
+        get_color="[r, g, b, a]",
         get_radius=300,
         pickable=True,
         opacity=0.6,
@@ -118,9 +131,9 @@ def show_mapa_dispersion(df: pd.DataFrame):
     )
     
     view_state = pdk.ViewState(
-        latitude=37.0902,
-        longitude=-95.7129,
-        zoom=4,
+        latitude=latitud,
+        longitude=longitud,
+        zoom=zoom,
         pitch=0,
         bearing=0,
         min_zoom=2,
@@ -168,100 +181,194 @@ def show_mapa_dispersion(df: pd.DataFrame):
         - 🟢 Verde = Alta Visibilidad
         """)
     
-# Mostrar mapa choropleth de estados
-def show_mapa_choropleth(df: pd.DataFrame):
-    st.markdown("### 🗺️ Mapa de Estados por Métricas de Accidentes")
+# Celdas de una resolución con su color por severidad promedio (sin Streamlit)
+def preparar_celdas(df: pd.DataFrame, cell_size: float) -> pd.DataFrame:
+    # Las celdas de todas las resoluciones se calculan una sola vez por dataset
+    df_celdas = get_data_manager().build_spatial_bins(df)[cell_size].copy()
+    df_celdas[colors.RGBA_COLUMNS] = colors.mean_severity_colors(df_celdas['Severidad_Promedio'])
+    return df_celdas
     
-    # Selector de métrica para el mapa de estados
-    state_metric = st.selectbox("📊 Métrica del mapa de estados", 
-                                ["Cantidad de Accidentes", "Severidad Promedio", "Temperatura Promedio"])
+# Mostrar mapa agregado por celdas (todos los accidentes, agrupados en el servidor)
+@profiled()
+def show_mapa_agregado(df: pd.DataFrame):
+    import pydeck as pdk
+    
+    resolucion = st.select_slider(
+        "🔍 Resolución de la cuadrícula",
+        options=list(spatial.GRID_RESOLUTIONS.keys()),
+        value="Media (0.25°)",
+    )
+    cell_size = spatial.GRID_RESOLUTIONS[resolucion]
+    
+    df_celdas = get_data_manager().cached_result(('mapa_celdas', cell_size), df,
+                                                 lambda: preparar_celdas(df, cell_size))
+    
+    st.info(f"⬢ {df_celdas['Accidentes'].sum():,} accidentes agrupados en {len(df_celdas):,} celdas")
+    
+    layer = pdk.Layer(
+        "ColumnLayer",
+        data=df_celdas,
+        get_position=["Lng", "Lat"],
+        get_elevation="Accidentes",
+        get_fill_color="[r, g, b, a]",
+        # Columnas hexagonales del tamaño de la celda
+        disk_resolution=6,
+        radius=cell_size * spatial.METERS_PER_DEGREE / 2,
+        elevation_scale=cell_size * spatial.METERS_PER_DEGREE / max(df_celdas['Accidentes'].max(), 1) * 5,
+        extruded=True,
+        pickable=True,
+    )
     
-    if not df.empty:
-        # Crear datos agregados por estado
-        agg_dict = {
-            'ID': 'count',
-            'Severity': 'mean',
-            'Start_Lat': 'mean',
-            'Start_Lng': 'mean'
+    view_state = pdk.ViewState(
+        latitude=37.0902,
+        longitude=-95.7129,
+        zoom=4,
+        pitch=40,
+        bearing=0,
+        min_zoom=2,
+        max_zoom=15,
+    )
+    
+    r = pdk.Deck(
+        layers=[layer],
+        initial_view_state=view_state,
+        tooltip={
+            "html": "<b>Accidentes:</b> {Accidentes}<br/>"
+                    "<b>Severidad promedio:</b> {Severidad_Promedio}",
+            "style": {"backgroundColor": "steelblue", "color": "white"}
+        },
+        map_style='road',
+    )
+    
+    st.pydeck_chart(r, use_container_width=True)
+    
+    st.markdown("#### 🎨 Leyenda")
+    st.markdown("""
+    - **Altura** = Cantidad de accidentes en la celda
+    - 🟢 → 🔴 **Color** = Severidad promedio (1 a 4)
+    """)
+    
+# Nombres de las columnas de DataManager.get_state_summary en el mapa de estados
+COLUMNAS_ESTADOS = {
+    'count': 'Accidentes',
+    'Severity': 'Severidad_Promedio',
+    'Start_Lat': 'Lat_Centro',
+    'Start_Lng': 'Lng_Centro',
+    'Temperature(F)': 'Temperatura_Promedio',
+}
+
+# Figura del mapa de estados para una métrica (sin Streamlit); None si no hay accidentes
+# df es el dataset completo: la tabla de regiones resuelve los filtros sin recorrer los registros
+# Retorna la figura y si la métrica pedida estaba disponible (la temperatura puede faltar)
+def figura_choropleth(df: pd.DataFrame, filtros: dict, state_metric: str) -> tuple:
+    import plotly.express as px
+    
+    disponible = True
+    # Datos agregados por estado (incluye la temperatura si existe)
+    state_data = get_data_manager().get_state_summary(df, filtros)
+    if state_data.empty:
+        return None, disponible
+    state_data = state_data.rename(columns=COLUMNAS_ESTADOS).reset_index()
+    state_data['State'] = state_data['State'].astype(str)
+    
+    # Configurar el mapa según la métrica seleccionada
+    if state_metric == "Cantidad de Accidentes":
+        color_column = 'Accidentes'
+        color_scale = 'Reds'
+        title = "Estados de EE.UU. Coloreados por Cantidad de Accidentes"
+        hover_data = {
+            'Accidentes': ':,',
+            'Severidad_Promedio': ':.2f',
+            'State': False
         }
-        
-        # Agregar temperatura si existe
-        if 'Temperature(F)' in df.columns:
-            agg_dict['Temperature(F)'] = 'mean'
-        
-        state_data = df.groupby('State').agg(agg_dict).round(2)
-        
-        # Renombrar columnas según lo que tengamos
-        if 'Temperature(F)' in df.columns:
-            state_data.columns = ['Accidentes', 'Severidad_Promedio', 'Lat_Centro', 'Lng_Centro', 'Temperatura_Promedio']
-        else:
-            state_data.columns = ['Accidentes', 'Severidad_Promedio', 'Lat_Centro', 'Lng_Centro']
-        
-        state_data = state_data.reset_index()
-        
-        # Configurar el mapa según la métrica seleccionada
-        if state_metric == "Cantidad de Accidentes":
-            color_column = 'Accidentes'
-            color_scale = 'Reds'
-            title = "Estados de EE.UU. Coloreados por Cantidad de Accidentes"
+        if 'Temperatura_Promedio' in state_data.columns:
+            hover_data['Temperatura_Promedio'] = ':.1f'
+            
+    elif state_metric == "Severidad Promedio":
+        color_column = 'Severidad_Promedio'
+        color_scale = 'YlOrRd'
+        title = "Estados de EE.UU. Coloreados por Severidad Promedio"
+        hover_data = {
+            'Accidentes': ':,',
+            'Severidad_Promedio': ':.2f',
+            'State': False
+        }
+        if 'Temperatura_Promedio' in state_data.columns:
+            hover_data['Temperatura_Promedio'] = ':.1f'
+            
+    else:  # Temperatura Promedio
+        if 'Temperatura_Promedio' in state_data.columns:
+            color_column = 'Temperatura_Promedio'
+            color_scale = 'RdYlBu_r'
+            title = "Estados de EE.UU. Coloreados por Temperatura Promedio"
             hover_data = {
                 'Accidentes': ':,',
                 'Severidad_Promedio': ':.2f',
+                'Temperatura_Promedio': ':.1f',
                 'State': False
             }
-            if 'Temperatura_Promedio' in state_data.columns:
-                hover_data['Temperatura_Promedio'] = ':.1f'
-                
-        elif state_metric == "Severidad Promedio":
-            color_column = 'Severidad_Promedio'
-            color_scale = 'YlOrRd'
-            title = "Estados de EE.UU. Coloreados por Severidad Promedio"
+        else:
+            # Fallback a cantidad si no hay temperatura
+            color_column = 'Accidentes'
+            color_scale = 'Reds'
+            title = "Estados de EE.UU. Coloreados por Cantidad de Accidentes"
             hover_data = {
                 'Accidentes': ':,',
                 'Severidad_Promedio': ':.2f',
                 'State': False
             }
-            if 'Temperatura_Promedio' in state_data.columns:
-                hover_data['Temperatura_Promedio'] = ':.1f'
-                
-        else:  # Temperatura Promedio
-            if 'Temperatura_Promedio' in state_data.columns:
-                color_column = 'Temperatura_Promedio'
-                color_scale = 'RdYlBu_r'
-                title = "Estados de EE.UU. Coloreados por Temperatura Promedio"
-                hover_data = {
-                    'Accidentes': ':,',
-                    'Severidad_Promedio': ':.2f',
-                    'Temperatura_Promedio': ':.1f',
-                    'State': False
-                }
-            else:
-                # Fallback a cantidad si no hay temperatura
-                color_column = 'Accidentes'
-                color_scale = 'Reds'
-                title = "Estados de EE.UU. Coloreados por Cantidad de Accidentes"
-                hover_data = {
-                    'Accidentes': ':,',
-                    'Severidad_Promedio': ':.2f',
-                    'State': False
-                }
-                st.warning("⚠️ Temperatura no disponible, mostrando cantidad de accidentes")
-        
-        # Crear el mapa choropleth
-        fig_choropleth = px.choropleth(
-            state_data,
-            locations='State',
-            color=color_column,
-            locationmode='USA-states',
-            hover_name='State',
-            hover_data=hover_data,
-            title=title,
-            color_continuous_scale=color_scale,
-            scope="usa"
-        )
-        fig_choropleth.update_layout(
-            height=500, 
-            geo=dict(bgcolor='rgba(0,0,0,0)'),
-            title_font_size=16
-        )
-        st.plotly_chart(fig_choropleth, use_container_width=True, key='geo_choropleth')
+            disponible = False
+    
+    # Crear el mapa choropleth
+    fig_choropleth = px.choropleth(
+        state_data,
+        locations='State',
+        color=color_column,
+        locationmode='USA-states',
+        hover_name='State',
+        hover_data=hover_data,
+        title=title,
+        color_continuous_scale=color_scale,
+        scope="usa"
+    )
+    fig_choropleth.update_layout(
+        height=500, 
+        geo=dict(bgcolor='rgba(0,0,0,0)'),
+        title_font_size=16
+    )
+    return fig_choropleth, disponible
+    
+# Mostrar mapa choropleth de estados
+# df: dataset completo; filtros: filtros activos (se aplican sobre la tabla de regiones)
+@profiled()
+def show_mapa_choropleth(df: pd.DataFrame, filtros: dict):
+    data_manager = get_data_manager()
+    st.markdown("### 🗺️ Mapa de Estados por Métricas de Accidentes")
+    
+    # Selector de métrica para el mapa de estados
+    state_metric = st.selectbox("📊 Métrica del mapa de estados", 
+                                ["Cantidad de Accidentes", "Severidad Promedio", "Temperatura Promedio"])
+    
+    # Cambiar de métrica o de filtros solo suma filas de la tabla de regiones
+    firma = data_manager.filter_signature(filtros)
+    fig_choropleth, disponible = data_manager.cached_result(
+        ('choropleth', state_metric, firma), df, lambda: figura_choropleth(df, filtros, state_metric)
+    )
+    if fig_choropleth is None:
+        st.warning("⚠️ No hay accidentes con los filtros seleccionados")
+        return
+    if not disponible:
+        st.warning("⚠️ Temperatura no disponible, mostrando cantidad de accidentes")
+    st.plotly_chart(fig_choropleth, use_container_width=True, key='geo_choropleth')
+    
+    # Ciudades con más accidentes (la tabla por ciudad no se divide por clima)
+    ciudades = data_manager.cached_result(
+        ('ciudades', firma), df, lambda: data_manager.get_city_summary(df, filtros, top=10)
+    )
+    if not ciudades.empty:
+        st.markdown("#### 🏙️ Ciudades con Más Accidentes")
+        if filtros.get('weather'):
+            st.caption("ℹ️ El ranking de ciudades no aplica el filtro de condición climática")
+        ciudades = ciudades.rename(columns=COLUMNAS_ESTADOS).reset_index()
+        st.dataframe(ciudades.drop(columns=['Lat_Centro', 'Lng_Centro'], errors='ignore'),
+                     use_container_width=True, hide_index=True)
@@ -1,76 +1,74 @@
-# Tab de Tabla Interactiva con filtros
+# Tab de Tabla Interactiva
 
 
 import streamlit as st
 import pandas as pd
+from data_manager import get_data_manager
+from profiling import profiled
+from .filtros import contar_registros
 
 
-# Mostrar tabla interactiva con filtros
+# Mostrar tabla interactiva de los datos filtrados
 # df : DataFrame con los datos de accidentes
-def show_tabla_interactiva(df: pd.DataFrame):
+# df_filtrado, filtros : resultado de show_filtros
+@profiled()
+def show_tabla_interactiva(df: pd.DataFrame, df_filtrado: pd.DataFrame, filtros: dict):
     st.markdown("### 📊 Exploración de Datos")
     
-    # Filtros en columnas
-    col1, col2, col3, col4 = st.columns(4)
+    data_manager = get_data_manager()
+    total_filtrados = contar_registros(df_filtrado)
     
-    with col1:
-        # Filtro por Estado
-        estados_disponibles = ['Todos'] + sorted(df['State'].unique().tolist())
-        estado_seleccionado = st.selectbox("🗺️ Estado", estados_disponibles, key="tabla_estado")
-    
-    with col2:
-        # Filtro por Severidad
-        severidades = ['Todas'] + sorted(df['Severity'].unique().tolist())
-        severidad_seleccionada = st.selectbox("🚨 Severidad", severidades, key="tabla_severidad")
-    
-    with col3:
-        # Filtro por Año
-        años = ['Todos'] + sorted(df['Year'].unique().tolist(), reverse=True)
-        año_seleccionado = st.selectbox("📅 Año", años, key="tabla_año")
-    
-    with col4:
-        # Filtro por Condición Climática (Top 10)
-        top_weather = df['Weather_Condition'].value_counts().head(10).index.tolist()
-        climas = ['Todas'] + top_weather
-        clima_seleccionado = st.selectbox("🌤️ Condición Climática", climas, key="tabla_clima")
-    
-    # Aplicar filtros
-    df_filtrado = df.copy()
-    
-    if estado_seleccionado != 'Todos':
-        df_filtrado = df_filtrado[df_filtrado['State'] == estado_seleccionado]
+    # Seleccionar columnas a mostrar
+    columnas_mostrar = ['Start_Time', 'City', 'State', 'Severity', 'Weather_Condition', 
+                       'Temperature(F)', 'Visibility(mi)', 'Distance(mi)']
     
-    if severidad_seleccionada != 'Todas':
-        df_filtrado = df_filtrado[df_filtrado['Severity'] == severidad_seleccionada]
+    # Controles de paginación y orden (el orden se aplica a todo el resultado filtrado)
+    col_orden, col_direccion, col_tamaño, col_pagina = st.columns(4)
     
-    if año_seleccionado != 'Todos':
-        df_filtrado = df_filtrado[df_filtrado['Year'] == año_seleccionado]
+    with col_orden:
+        orden = st.selectbox("↕️ Ordenar por", ['Sin orden'] + columnas_mostrar, key="tabla_orden")
     
-    if clima_seleccionado != 'Todas':
-        df_filtrado = df_filtrado[df_filtrado['Weather_Condition'] == clima_seleccionado]
+    with col_direccion:
+        direccion = st.radio("Dirección", ["Ascendente", "Descendente"], horizontal=True, key="tabla_direccion")
     
-    # Mostrar estadísticas de filtrado
-    st.info(f"📊 Mostrando {len(df_filtrado):,} registros de {len(df):,} totales ({len(df_filtrado)/len(df)*100:.1f}%)")
+    with col_tamaño:
+        tamaño_pagina = st.selectbox("📄 Filas por página", [25, 50, 100, 500, 1000], index=2, key="tabla_tamaño")
     
-    # Seleccionar columnas a mostrar
-    columnas_mostrar = ['Start_Time', 'City', 'State', 'Severity', 'Weather_Condition', 
-                       'Temperature(F)', 'Visibility(mi)', 'Distance(mi)']
+    total_paginas = max((total_filtrados + tamaño_pagina - 1) // tamaño_pagina, 1)
+    with col_pagina:
+        pagina = st.number_input("📑 Página", min_value=1, max_value=total_paginas, value=1, step=1, key="tabla_pagina")
     
-    # Mostrar tabla interactiva
+    # Mostrar tabla interactiva (solo la página actual)
+    df_pagina = data_manager.get_table_page(
+        df, filtros, columnas_mostrar,
+        sort_column=None if orden == 'Sin orden' else orden,
+        ascending=direccion == "Ascendente",
+        page=int(pagina) - 1,
+        page_size=tamaño_pagina,
+    )
     st.dataframe(
-        df_filtrado[columnas_mostrar].head(1000),
+        df_pagina,
         use_container_width=True,
         height=400
     )
+    st.caption(f"Página {int(pagina):,} de {total_paginas:,}")
     
-    # Botón de descarga
-    csv = df_filtrado.to_csv(index=False).encode('utf-8')
-    st.download_button(
-        label="📥 Descargar datos filtrados (CSV)",
-        data=csv,
-        file_name=f"accidentes_filtrados_{estado_seleccionado}_{año_seleccionado}.csv",
-        mime="text/csv",
-    )
+    # Descarga bajo demanda: el archivo se escribe por bloques solo al pedirlo y se reutiliza
+    # mientras no cambien los filtros. El botón de descarga (que lleva el archivo completo en
+    # memoria) solo se dibuja en el rerun que lo preparó, no en cada rerun posterior
+    col_formato, col_descarga = st.columns(2)
+    with col_formato:
+        formato = st.radio("📄 Formato de descarga", ["CSV", "Parquet"], horizontal=True, key="tabla_formato")
+    fmt = formato.lower()
     
-    # Retornar el DataFrame filtrado para que otros tabs puedan usarlo
-    return df_filtrado
+    with col_descarga:
+        if st.button("📦 Preparar descarga"):
+            with st.spinner("Exportando datos filtrados..."):
+                export_path = data_manager.export_data(df_filtrado, filtros, fmt)
+            with open(export_path, 'rb') as archivo:
+                st.download_button(
+                    label=f"📥 Descargar datos filtrados ({formato})",
+                    data=archivo,
+                    file_name=f"accidentes_filtrados_{(filtros['states'] or ['Todos'])[0]}_{(filtros['years'] or ['Todos'])[0]}.{fmt}",
+                    mime="text/csv" if fmt == 'csv' else "application/octet-stream",
+                )